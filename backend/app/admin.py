@@ -0,0 +1,80 @@
+"""Maintenance commands for the analysis database.
+
+Usage (from the backend directory):
+
+    python -m app.admin rebuild-counters [--dry-run]
+    python -m app.admin ensure-indexes
+    python -m app.admin compact-records [--batch-size N] [--dry-run]
+    python -m app.admin check-rules PATH
+"""
+import argparse
+import json
+import sys
+
+from app import database
+from app.rules import load_rule_pack
+
+
+def rebuild_counters(args) -> int:
+    drift = database.rebuild_risk_counters(dry_run=args.dry_run)
+    histogram_drift = database.rebuild_risk_score_histogram(dry_run=args.dry_run)
+    print(json.dumps({
+        "drift": drift,
+        "score_histogram_drift": histogram_drift,
+        "applied": bool(drift or histogram_drift) and not args.dry_run
+    }, indent=2, sort_keys=True))
+    # Non-zero exit on drift in dry-run mode so it can gate a cron/CI check
+    return 1 if (drift or histogram_drift) and args.dry_run else 0
+
+
+def ensure_indexes(args) -> int:
+    print(json.dumps({"indexes": database.ensure_indexes()}, indent=2))
+    return 0
+
+
+def compact_records(args) -> int:
+    stats = database.compact_existing_records(batch_size=args.batch_size, dry_run=args.dry_run)
+    print(json.dumps({**stats, "applied": not args.dry_run}, indent=2, sort_keys=True))
+    return 1 if stats["skipped"] else 0
+
+
+def check_rules(args) -> int:
+    try:
+        pack = load_rule_pack(args.path)
+    except (OSError, ValueError) as e:
+        print(f"invalid rule pack: {e}", file=sys.stderr)
+        return 1
+    print(json.dumps({
+        "version": pack.version,
+        "bias_terms": len(pack.bias_terms),
+        "injection_patterns": len(pack.injection_patterns)
+    }, indent=2, sort_keys=True))
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.admin", description="Analysis database maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-counters", help="recompute risk_counters and the risk-score histogram from raw analyses")
+    rebuild.add_argument("--dry-run", action="store_true", help="only report drift, do not rewrite counters")
+    rebuild.set_defaults(handler=rebuild_counters)
+
+    indexes = commands.add_parser("ensure-indexes", help="create missing indexes and apply retention settings")
+    indexes.set_defaults(handler=ensure_indexes)
+
+    compact = commands.add_parser("compact-records", help="convert stored analyses to the compact format")
+    compact.add_argument("--batch-size", type=int, default=1000)
+    compact.add_argument("--dry-run", action="store_true", help="only report how many and how much would change")
+    compact.set_defaults(handler=compact_records)
+
+    rules = commands.add_parser("check-rules", help="validate a rule pack before deploying it")
+    rules.add_argument("path")
+    rules.set_defaults(handler=check_rules)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,28 +1,209 @@
-import re
+from collections import OrderedDict
 from typing import Dict, List, Any
+import logging
+import threading
+import time
+import numpy as np
+from app.detection import Detector, StreamScan
+from app.rules import RULES_PATH, RULES_POLL_INTERVAL, RulePack, RuleSource
+
+logger = logging.getLogger(__name__)
 
 # Risk detection parameters
 RISK_THRESHOLD = 0.7
+# Built-in rules, used unless RULES_PATH points at a rule pack
 PII_REGEX = r"\b\d{3}-\d{2}-\d{4}\b|\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b|\b\d{3}[-.]?\d{3}[-.]?\d{4}\b"
 BIAS_TERMS = ["race", "gender", "religion", "ethnicity", "stereotype", "prejudice", "bias", "discriminate"]
 INJECTION_PATTERNS = ["ignore previous", "system prompt", "### instruction", "ignore above", "disregard prior"]
 
+class RulesChanged(RuntimeError):
+    """The rule pack a streamed prompt started with is unknown to this process"""
+
+# The active detector is replaced, never mutated: an analysis that already
+# holds the previous one finishes with it. Recent detectors stay reachable
+# by version so a stream that outlives a swap keeps its rules.
+_detector = RulePack("builtin", PII_REGEX, BIAS_TERMS, INJECTION_PATTERNS).compile()
+_recent = OrderedDict([(_detector.version, _detector)])
+_RECENT_DETECTORS = 8
+_install_lock = threading.Lock()
+_rule_source = RuleSource(RULES_PATH) if RULES_PATH else None
+# When the API process's watcher refreshes the rules, analyses never check
+# the file themselves; elsewhere they check at most every RULES_POLL_INTERVAL
+_rules_watched = False
+_next_poll = 0.0
+
+def install_detector(detector: Detector) -> Detector:
+    """Atomically make detector the one used by new analyses"""
+    global _detector
+    with _install_lock:
+        _recent[detector.version] = detector
+        _recent.move_to_end(detector.version)
+        while len(_recent) > _RECENT_DETECTORS:
+            _recent.popitem(last=False)
+        _detector = detector
+    return detector
+
+def reload_detector() -> Detector:
+    """Recompile the detector from the current module-level rule lists"""
+    return install_detector(RulePack("builtin", PII_REGEX, BIAS_TERMS, INJECTION_PATTERNS).compile())
+
+def refresh_rules(force: bool = False) -> bool:
+    """Install the RULES_PATH pack if the file changed; True if a new pack was installed.
+
+    Raises ValueError for an invalid pack, leaving the current rules active.
+    """
+    if _rule_source is None:
+        return False
+    pack = _rule_source.poll(force=force)
+    if pack is None:
+        return False
+    install_detector(pack.compile())
+    logger.info("Installed rule pack %s from %s", pack.version, RULES_PATH)
+    return True
+
+def set_rules_watched(watched: bool = True):
+    """Leave rule refreshes to a watcher (True) or to active_detector() (False)"""
+    global _rules_watched
+    _rules_watched = watched
+
+def active_detector() -> Detector:
+    """The current detector, after picking up a changed rule pack file.
+
+    Unless a watcher refreshes the rules, the file is checked (one stat()
+    call) at most every RULES_POLL_INTERVAL seconds, which lets detection
+    worker processes follow a new pack without being restarted.
+    """
+    global _next_poll
+    if _rule_source is not None and not _rules_watched:
+        now = time.monotonic()
+        if now >= _next_poll:
+            _next_poll = now + RULES_POLL_INTERVAL
+            try:
+                refresh_rules()
+            except ValueError:
+                pass  # already logged; keep serving the current rules
+    return _detector
+
 def analyze_prompt(prompt: str) -> Dict[str, Any]:
     """Analyze prompt for risks without storing raw data"""
+    detector = active_detector()
+    pii_matches, bias_matches, injection_matches = detector.detect(prompt)
+    risk_factors = _risk_factors(pii_matches, bias_matches, injection_matches)
+    risk_score = _risk_score(risk_factors)
+    
+    return {
+        "raw_risk": risk_score,
+        "risk_factors": risk_factors,
+        "suggestions": generate_suggestions(risk_factors),
+        "needs_review": risk_score > RISK_THRESHOLD,
+        "rules_version": detector.version,
+        "matched_terms": _matched_terms(bias_matches, injection_matches)
+    }
+
+def analyze_batch(prompts: List[str]) -> List[Dict[str, Any]]:
+    """Analyze many prompts, scoring the whole batch with array operations"""
+    detector = active_detector()
+    batch_hits = [detector.detect(prompt) for prompt in prompts]
+    batch_factors = [_risk_factors(*hits) for hits in batch_hits]
+    
+    # One row per prompt: number of factors and per-factor match counts
+    n_factors = np.fromiter((len(f) for f in batch_factors), dtype=np.float64, count=len(prompts))
+    counts = np.zeros((len(prompts), 3), dtype=np.float64)
+    for row, risk_factors in enumerate(batch_factors):
+        for col, factor in enumerate(risk_factors):
+            counts[row, col] = factor.get("count", 0)
+    risk_scores = np.minimum(1.0, n_factors * 0.3 + (counts * 0.02).sum(axis=1))
+    needs_review = risk_scores > RISK_THRESHOLD
+    
+    return [
+        {
+            "raw_risk": float(risk_scores[i]),
+            "risk_factors": risk_factors,
+            "suggestions": generate_suggestions(risk_factors),
+            "needs_review": bool(needs_review[i]),
+            "rules_version": detector.version,
+            "matched_terms": _matched_terms(*batch_hits[i][1:])
+        }
+        for i, risk_factors in enumerate(batch_factors)
+    ]
+
+def start_stream() -> StreamScan:
+    """Begin analyzing a prompt that arrives in chunks"""
+    return active_detector().stream()
+
+def feed_stream(scan: StreamScan, chunk: str, final: bool = False) -> StreamScan:
+    """Scan one chunk of a streamed prompt (picklable, for run_analysis).
+
+    Raises RulesChanged if this process no longer has the stream's rule
+    pack; the process that started the stream always does.
+    """
+    active_detector()
+    return _stream_detector(scan).feed(scan, chunk, final=final)
+
+def stream_risk_score(scan: StreamScan) -> float:
+    """Score of what has been scanned so far; it can only grow with more input"""
+    return _risk_score(_stream_factors(scan))
+
+def finish_stream(scan: StreamScan) -> Dict[str, Any]:
+    """Analysis of a fully fed stream, in the same shape as analyze_prompt"""
+    pii_sample, pii_count, bias_matches, injection_matches = _stream_detector(scan).stream_result(scan)
+    risk_factors = _risk_factors(pii_sample, bias_matches, injection_matches, pii_count=pii_count)
+    risk_score = _risk_score(risk_factors)
+    return {
+        "raw_risk": risk_score,
+        "risk_factors": risk_factors,
+        "suggestions": generate_suggestions(risk_factors),
+        "needs_review": risk_score > RISK_THRESHOLD,
+        "rules_version": scan.rules_version,
+        "matched_terms": _matched_terms(bias_matches, injection_matches)
+    }
+
+def _stream_detector(scan: StreamScan) -> Detector:
+    detector = _detector
+    if detector.version == scan.rules_version:
+        return detector
+    detector = _recent.get(scan.rules_version)
+    if detector is None:
+        raise RulesChanged(f"Rule pack {scan.rules_version} is no longer loaded")
+    return detector
+
+def _stream_factors(scan: StreamScan) -> List[Dict]:
+    pii_sample, pii_count, bias_matches, injection_matches = _stream_detector(scan).stream_result(scan)
+    return _risk_factors(pii_sample, bias_matches, injection_matches, pii_count=pii_count)
+
+def _matched_terms(bias_matches: List[str], injection_matches: List[str]) -> List[str]:
+    """Every distinct term hit, in rule-list order.
+
+    Unlike the matches in risk_factors, which are truncated for display,
+    this is complete and the same in every process, for analytics sketches.
+    """
+    return list(dict.fromkeys(bias_matches + injection_matches))
+
+def _risk_score(risk_factors: List[Dict]) -> float:
+    """Raw risk score (0-1)"""
+    return min(1.0, 
+        len(risk_factors) * 0.3 + 
+        sum(factor.get("count", 0) * 0.02 for factor in risk_factors)
+    )
+
+def _risk_factors(pii_matches: List[str], bias_matches: List[str], injection_matches: List[str],
+                  pii_count: int = None) -> List[Dict]:
+    """Build the risk factor list from detector hits.
+
+    pii_count overrides len(pii_matches) when only a sample of the matches
+    was kept, as for streamed prompts.
+    """
     risk_factors = []
     
     # PII Detection
-    pii_matches = re.findall(PII_REGEX, prompt)
     if pii_matches:
         risk_factors.append({
             "type": "PII", 
             "matches": list(set(pii_matches))[:3],  # Limit matches
-            "count": len(pii_matches)
+            "count": len(pii_matches) if pii_count is None else pii_count
         })
     
     # Bias Detection
-    lower_prompt = prompt.lower()
-    bias_matches = [term for term in BIAS_TERMS if term in lower_prompt]
     if bias_matches:
         risk_factors.append({
             "type": "BIAS", 
@@ -31,26 +212,13 @@ def analyze_prompt(prompt: str) -> Dict[str, Any]:
         })
     
     # Injection Detection
-    injection_matches = [patt for patt in INJECTION_PATTERNS if patt in lower_prompt]
     if injection_matches:
         risk_factors.append({
             "type": "INJECTION", 
             "matches": injection_matches,
             "count": len(injection_matches)
         })
-    
-    # Calculate raw risk score (0-1)
-    risk_score = min(1.0, 
-        len(risk_factors) * 0.3 + 
-        sum(factor.get("count", 0) * 0.02 for factor in risk_factors)
-    )
-    
-    return {
-        "raw_risk": risk_score,
-        "risk_factors": risk_factors,
-        "suggestions": generate_suggestions(risk_factors),
-        "needs_review": risk_score > RISK_THRESHOLD
-    }
+    return risk_factors
 
 def generate_suggestions(risk_factors: List[Dict]) -> List[str]:
     """Generate privacy-preserving suggestions"""
@@ -62,4 +230,11 @@ def generate_suggestions(risk_factors: List[Dict]) -> List[str]:
             suggestions.append("Review for potential bias")
         elif factor["type"] == "INJECTION":
             suggestions.append("Validate prompt intentions")
-    return list(set(suggestions))
\ No newline at end of file
+    return list(set(suggestions))
+
+# Pick up RULES_PATH at import so every process starts on the configured pack
+if _rule_source is not None:
+    try:
+        refresh_rules()
+    except ValueError:
+        logger.error("Falling back to built-in rules")
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+from app.metrics import metrics
+from app.shared_state import shared_path
+
+logger = logging.getLogger(__name__)
+
+# Analytics cache configuration (ANALYTICS_CACHE_TTL=0 disables caching)
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_CACHE_MAX_NEW_RECORDS = int(os.getenv("ANALYTICS_CACHE_MAX_NEW_RECORDS", "1000"))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "128"))
+ANALYTICS_CACHE_PATH = os.getenv("ANALYTICS_CACHE_PATH") or shared_path("analytics.db")
+
+class SharedAnalyticsStore:
+    """Released analytics and the persisted-records count in a SQLite file shared by every worker.
+
+    Released values are differentially private, so unlike the result
+    cache the file may live on disk. Times are wall-clock, since monotonic
+    clocks are not comparable across processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # a lost write is only a cache miss
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS releases "
+            "(key TEXT PRIMARY KEY, released_at REAL NOT NULL, records_at_release INTEGER NOT NULL, "
+            "value TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY CHECK (id = 0), n INTEGER)")
+        self._conn.execute("INSERT OR IGNORE INTO records (id, n) VALUES (0, 0)")
+
+    def add_records(self, count: int):
+        with self._lock:
+            self._conn.execute("UPDATE records SET n = n + ? WHERE id = 0", (count,))
+
+    def get(self, key: str) -> Optional[Tuple[float, int, int, Any]]:
+        """(released_at, records_at_release, records_now, value), or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT released_at, records_at_release, (SELECT n FROM records WHERE id = 0), value "
+                "FROM releases WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        released_at, records_at_release, records_now, value = row
+        return released_at, records_at_release, records_now, json.loads(value)
+
+    def put(self, key: str, value: Any, max_entries: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO releases (key, released_at, records_at_release, value) "
+                "VALUES (?, ?, (SELECT n FROM records WHERE id = 0), ?)",
+                (key, time.time(), json.dumps(value))
+            )
+            self._conn.execute(
+                "DELETE FROM releases WHERE key IN "
+                "(SELECT key FROM releases ORDER BY released_at DESC LIMIT -1 OFFSET ?)",
+                (max_entries,)
+            )
+
+    def expire(self, key: str, released_at: float):
+        """Delete the entry released at released_at; a newer release of key is kept"""
+        with self._lock:
+            self._conn.execute("DELETE FROM releases WHERE key = ? AND released_at = ?", (key, released_at))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM releases")
+
+class AnalyticsCache:
+    """Released analytics responses, re-served until their epoch ends.
+
+    Returning a value that was already released is post-processing, so a hit
+    spends no privacy budget and does no database work. An entry expires
+    after ttl seconds or once max_new_records analyses have been persisted
+    by this process since it was released, whichever comes first.
+    Concurrent misses for the same key share one release, which runs in its
+    own task: a caller that is cancelled (say, its client disconnected)
+    stops waiting, but the release still completes for the others and is
+    cached, so the budget it spent is not wasted.
+
+    With a SharedAnalyticsStore, entries and the record count are shared
+    by every worker, so a value released by one worker is served by all
+    and records persisted anywhere count towards expiry. Concurrent misses
+    in different workers may each release. The store is bookkeeping only:
+    async callers reach it in a thread, and a SQLite error is logged and
+    treated as a miss rather than failing the request.
+    """
+
+    def __init__(self, ttl: float = 60.0, max_new_records: int = 1000, max_entries: int = 128,
+                 shared: SharedAnalyticsStore = None):
+        self.ttl = ttl
+        self.max_new_records = max_new_records
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (released_at, records_at_release, value)
+        self._inflight = {}
+        self._records = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def note_records(self, count: int):
+        """Record that `count` analyses were persisted"""
+        if self.shared is not None:
+            try:
+                self.shared.add_records(count)
+            except sqlite3.Error as e:
+                # Entries may then be served a little past max_new_records
+                logger.warning("Could not count %d records in the shared analytics cache: %s", count, e)
+            return
+        with self._lock:
+            self._records += count
+
+    async def note_records_async(self, count: int):
+        """note_records() for async callers; a shared store is written in a thread"""
+        if self.shared is not None:
+            await asyncio.to_thread(self.note_records, count)
+        else:
+            self.note_records(count)
+
+    def get(self, key: Hashable):
+        if self.shared is not None:
+            return self._get_shared(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            released_at, records_at_release, value = entry
+            if (time.monotonic() - released_at >= self.ttl or
+                    self._records - records_at_release >= self.max_new_records):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.shared is not None:
+            try:
+                self.shared.put(_shared_key(key), value, self.max_entries)
+            except sqlite3.Error as e:
+                logger.warning("Could not store a release in the shared analytics cache: %s", e)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), self._records, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        if self.shared is not None:
+            self.shared.clear()
+        with self._lock:
+            self._entries.clear()
+
+    def _get_shared(self, key: Hashable):
+        key = _shared_key(key)
+        try:
+            entry = self.shared.get(key)
+            if entry is None:
+                return None
+            released_at, records_at_release, records_now, value = entry
+            if (time.time() - released_at >= self.ttl or
+                    records_now - records_at_release >= self.max_new_records):
+                self.shared.expire(key, released_at)
+                return None
+        except sqlite3.Error as e:
+            logger.warning("Shared analytics cache unavailable, releasing afresh: %s", e)
+            return None
+        return value
+
+    async def _get_async(self, key: Hashable):
+        if self.shared is not None:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def get_or_release(self, key: Hashable, release: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (value, hit), calling release() only on a miss"""
+        if not self.enabled:
+            metrics.inc("analytics_cache_requests_total", result="bypass")
+            return await release(), False
+
+        value = await self._get_async(key)
+        if value is None and key in self._inflight:
+            value = await asyncio.shield(self._inflight[key])
+        if value is not None:
+            metrics.inc("analytics_cache_requests_total", result="hit")
+            return value, True
+
+        metrics.inc("analytics_cache_requests_total", result="miss")
+        task = self._inflight[key] = asyncio.create_task(self._release(key, release))
+        # Waiters re-raise a failure; retrieve it so a release nobody awaits anymore doesn't log
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return await asyncio.shield(task), False
+
+    async def _release(self, key: Hashable, release: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await release()
+            if self.shared is not None:
+                await asyncio.to_thread(self.put, key, value)
+            else:
+                self.put(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+def _shared_key(key: Hashable) -> str:
+    return json.dumps(key, default=str)
+
+analytics_cache = AnalyticsCache(
+    ttl=ANALYTICS_CACHE_TTL,
+    max_new_records=ANALYTICS_CACHE_MAX_NEW_RECORDS,
+    max_entries=ANALYTICS_CACHE_MAX_ENTRIES,
+    shared=SharedAnalyticsStore(ANALYTICS_CACHE_PATH) if ANALYTICS_CACHE_PATH and ANALYTICS_CACHE_TTL > 0 else None
+)
@@ -0,0 +1,201 @@
+"""Offline re-scoring of JSONL prompt logs.
+
+Usage (from the backend directory):
+
+    python -m app.bulk_score logs/ -o scored.jsonl
+    python -m app.bulk_score export.jsonl.gz -o scored.parquet --format parquet --text-field body
+
+Inputs are JSONL files (optionally gzipped) or directories searched for
+them. Lines are read lazily and handed to worker processes in chunks; at
+most workers * 2 chunks are in flight, so memory stays flat however large
+the corpus is. Output rows keep input order. Nothing is written to MongoDB
+and no privacy budget is spent.
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from typing import Iterator, List, Optional, Tuple
+
+from app.analysis import analyze_batch
+
+# Raw input line with its origin: (source file, 1-based line number, text)
+Line = Tuple[str, int, str]
+
+PATTERNS = (".jsonl", ".jsonl.gz", ".ndjson", ".ndjson.gz")
+
+
+def iter_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.endswith(PATTERNS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def iter_lines(paths: List[str]) -> Iterator[Line]:
+    for path in iter_files(paths):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+            for line_no, text in enumerate(f, start=1):
+                if text.strip():
+                    yield path, line_no, text
+
+
+def iter_chunks(lines: Iterator[Line], size: int) -> Iterator[List[Line]]:
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_chunk(chunk: List[Line], text_field: str, id_field: Optional[str], as_jsonl: bool):
+    """Parse and score one work unit in a worker process.
+
+    Returns (rows, prompts scored, errors); rows are already serialized
+    when writing JSONL so the parent process only copies bytes.
+    """
+    rows, prompts, positions = [], [], []
+    for source, line_no, text in chunk:
+        row = {"source": source, "line": line_no, "id": None, "error": None}
+        try:
+            record = json.loads(text)
+            prompt = record[text_field]
+            if not isinstance(prompt, str):
+                raise TypeError(f"{text_field} is not a string")
+            if id_field is not None and record.get(id_field) is not None:
+                row["id"] = str(record[id_field])
+            positions.append(len(rows))
+            prompts.append(prompt)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            row["error"] = f"{type(e).__name__}: {e}"
+        rows.append(row)
+
+    for position, analysis in zip(positions, analyze_batch(prompts)):
+        rows[position].update({
+            "risk_score": analysis["raw_risk"],
+            "risk_types": [factor["type"] for factor in analysis["risk_factors"]],
+            "risk_factors": analysis["risk_factors"],
+            "suggestions": analysis["suggestions"],
+            "needs_review": analysis["needs_review"],
+            "rules_version": analysis["rules_version"]
+        })
+
+    errors = len(rows) - len(prompts)
+    if as_jsonl:
+        return "".join(json.dumps(row) + "\n" for row in rows), len(prompts), errors
+    return rows, len(prompts), errors
+
+
+class JSONLWriter:
+    def __init__(self, path: str):
+        self._file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, block: str):
+        self._file.write(block)
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetWriter:
+    """Writes each chunk as a row group; needs the optional pyarrow package"""
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pa
+        self._schema = pa.schema([
+            ("source", pa.string()),
+            ("line", pa.int64()),
+            ("id", pa.string()),
+            ("error", pa.string()),
+            ("risk_score", pa.float64()),
+            ("risk_types", pa.list_(pa.string())),
+            ("risk_factors", pa.string()),  # JSON, as match lists vary by type
+            ("suggestions", pa.list_(pa.string())),
+            ("needs_review", pa.bool_()),
+            ("rules_version", pa.string())
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, rows: List[dict]):
+        for row in rows:
+            if "risk_factors" in row:
+                row["risk_factors"] = json.dumps(row["risk_factors"])
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def run(args) -> Tuple[int, int]:
+    writer = ParquetWriter(args.output) if args.format == "parquet" else JSONLWriter(args.output)
+    as_jsonl = args.format == "jsonl"
+    chunks = iter_chunks(iter_lines(args.inputs), args.chunk_size)
+    scored = errors = 0
+    try:
+        with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(score_chunk, (chunk, args.text_field, args.id_field, as_jsonl)))
+                # Bound in-flight work; results are written in input order
+                while len(pending) >= args.workers * 2:
+                    scored, errors = _write(writer, pending.popleft().get(), scored, errors)
+            while pending:
+                scored, errors = _write(writer, pending.popleft().get(), scored, errors)
+    finally:
+        writer.close()
+    return scored, errors
+
+
+def _write(writer, result, scored: int, errors: int) -> Tuple[int, int]:
+    rows, n_scored, n_errors = result
+    writer.write(rows)
+    return scored + n_scored, errors + n_errors
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bulk_score", description="Re-score JSONL prompt logs")
+    parser.add_argument("inputs", nargs="+", help="JSONL files (optionally .gz) or directories")
+    parser.add_argument("-o", "--output", required=True, help="output path, or - for stdout (JSONL only)")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--text-field", default="prompt", help="field holding the prompt text")
+    parser.add_argument("--id-field", default=None, help="field copied to each result as its id")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="prompts per work unit")
+    args = parser.parse_args(argv)
+    if args.format == "parquet" and args.output == "-":
+        parser.error("parquet output needs a file path")
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be positive")
+
+    start = time.perf_counter()
+    scored, errors = run(args)
+    elapsed = time.perf_counter() - start
+    print(
+        f"scored {scored} prompts in {elapsed:.2f}s ({scored / max(elapsed, 1e-9):.0f} prompts/s) "
+        f"with {args.workers} workers; {errors} unreadable lines",
+        file=sys.stderr
+    )
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import math
+from typing import Dict
+
+# Rényi orders tracked for every allocation
+RDP_ORDERS = (1.25, 1.5, 1.75, 2, 2.5, 3, 4, 5, 6, 8, 10, 12, 16, 20, 24, 32, 48, 64, 128, 256)
+
+def laplace_rdp(order: float, epsilon: float) -> float:
+    """Rényi divergence of order `order` for the ε-DP Laplace mechanism (Mironov 2017)"""
+    a = math.log(order / (2 * order - 1)) + (order - 1) * epsilon
+    b = math.log((order - 1) / (2 * order - 1)) - order * epsilon
+    top = max(a, b)
+    return (top + math.log(math.exp(a - top) + math.exp(b - top))) / (order - 1)
+
+def privacy_costs(epsilon: float) -> Dict[str, float]:
+    """Additive privacy moments of one ε-DP Laplace release.
+
+    Every accountant is a function of these running sums, so they are all
+    recorded on each allocation and the accountant can be switched without
+    losing track of what was already spent.
+    """
+    costs = {
+        "epsilon": epsilon,
+        "epsilon_sq": epsilon ** 2,
+        "epsilon_expm1": epsilon * math.expm1(epsilon),
+        "rho": epsilon ** 2 / 2
+    }
+    for order in RDP_ORDERS:
+        costs[f"rdp_{order}"] = laplace_rdp(order, epsilon)
+    return costs
+
+class BasicComposition:
+    """Sequential composition: epsilons add up"""
+
+    name = "basic"
+    delta = 0.0
+
+    def spent(self, totals: Dict[str, float]) -> float:
+        return totals.get("epsilon", 0.0)
+
+class AdvancedComposition(BasicComposition):
+    """Advanced composition for heterogeneous ε_i (Dwork, Rothblum & Vadhan 2010).
+
+    ε' = sqrt(2 ln(1/δ) Σε_i²) + Σε_i(e^ε_i - 1), falling back to the basic
+    bound whenever that is tighter.
+    """
+
+    name = "advanced"
+
+    def __init__(self, delta: float):
+        self.delta = delta
+
+    def spent(self, totals: Dict[str, float]) -> float:
+        advanced = (
+            math.sqrt(2 * math.log(1 / self.delta) * totals.get("epsilon_sq", 0.0)) +
+            totals.get("epsilon_expm1", 0.0)
+        )
+        return min(super().spent(totals), advanced)
+
+class ZCDPComposition(BasicComposition):
+    """Zero-concentrated DP: ε-DP releases are ε²/2-zCDP and ρ adds up.
+
+    Converted with ε' = ρ + 2 sqrt(ρ ln(1/δ)) (Bun & Steinke 2016).
+    """
+
+    name = "zcdp"
+
+    def __init__(self, delta: float):
+        self.delta = delta
+
+    def spent(self, totals: Dict[str, float]) -> float:
+        rho = totals.get("rho", 0.0)
+        return min(super().spent(totals), rho + 2 * math.sqrt(rho * math.log(1 / self.delta)))
+
+class RDPComposition(BasicComposition):
+    """Rényi DP accounting over RDP_ORDERS.
+
+    Converted with ε' = min_α R(α) + ln(1/δ)/(α - 1) (Mironov 2017).
+    """
+
+    name = "rdp"
+
+    def __init__(self, delta: float):
+        self.delta = delta
+
+    def spent(self, totals: Dict[str, float]) -> float:
+        log_inv_delta = math.log(1 / self.delta)
+        rdp = min(
+            totals.get(f"rdp_{order}", 0.0) + log_inv_delta / (order - 1)
+            for order in RDP_ORDERS
+        )
+        return min(super().spent(totals), rdp)
+
+COMPOSITIONS = {
+    "basic": BasicComposition,
+    "advanced": AdvancedComposition,
+    "zcdp": ZCDPComposition,
+    "rdp": RDPComposition
+}
+
+def make_composition(name: str, delta: float = 1e-6) -> BasicComposition:
+    """Build the accountant named by PRIVACY_ACCOUNTANT"""
+    if name not in COMPOSITIONS:
+        raise ValueError(f"Unknown privacy accountant: {name}")
+    if name == "basic":
+        return BasicComposition()
+    if not 0 < delta < 1:
+        raise ValueError("PRIVACY_DELTA must be in (0, 1)")
+    return COMPOSITIONS[name](delta)
@@ -0,0 +1,192 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Optional, Sequence
+
+import numpy as np
+
+from app.database import RISK_TYPES
+from app.dp_utils import laplace_noise
+from app.privacy_accountant import accountant
+from app.shared_state import shared_path
+
+# Continual release of risk counters (disabled unless CONTINUAL_RELEASE_EPSILON is set)
+CONTINUAL_RELEASE_EPSILON = float(os.getenv("CONTINUAL_RELEASE_EPSILON", "0"))
+CONTINUAL_RELEASE_HORIZON = int(os.getenv("CONTINUAL_RELEASE_HORIZON", str(2 ** 24)))
+CONTINUAL_RELEASE_PATH = os.getenv("CONTINUAL_RELEASE_PATH") or shared_path("continual.db")
+
+State = Dict
+
+# State fields holding numpy arrays, stored as nested lists
+_ARRAYS = ("base", "exact", "noisy")
+
+class MemoryTreeStore:
+    """Tree state kept in this process; lost on restart"""
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+
+    def transact(self, fn: Callable[[Optional[State]], Optional[State]]):
+        """Replace the state with fn(state) unless it returns None"""
+        with self._lock:
+            updated = fn(self._state)
+            if updated is not None:
+                self._state = updated
+
+    def load(self) -> Optional[State]:
+        with self._lock:
+            return self._state
+
+class SQLiteTreeStore:
+    """Tree state in a SQLite file shared by every process using it.
+
+    Updates run in BEGIN IMMEDIATE transactions, as in SQLiteLedger, so
+    workers appending steps concurrently see one sequence of time steps.
+    """
+
+    def __init__(self, path: str, name: str = "risk"):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS trees (name TEXT PRIMARY KEY, state TEXT NOT NULL)")
+
+    def transact(self, fn: Callable[[Optional[State]], Optional[State]]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                updated = fn(self._read())
+                if updated is None:
+                    self._conn.execute("ROLLBACK")
+                    return
+                encoded = {key: value.tolist() if key in _ARRAYS else value for key, value in updated.items()}
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO trees (name, state) VALUES (?, ?)", (self.name, json.dumps(encoded))
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self) -> Optional[State]:
+        with self._lock:
+            return self._read()
+
+    def _read(self) -> Optional[State]:
+        row = self._conn.execute("SELECT state FROM trees WHERE name = ?", (self.name,)).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        return {key: np.array(value) if key in _ARRAYS else value for key, value in state.items()}
+
+class BinaryTreeCounters:
+    """Counters released under continual observation with the binary tree mechanism.
+
+    Every add() is one time step carrying a count per counter. Step t
+    closes the dyadic interval ending at t, whose exact sum is kept only
+    until its noisy value is drawn; a read sums the noisy nodes for the set
+    bits of t. So each counter holds O(log horizon) values, every step
+    falls in at most `levels` released nodes, and reads are post-processing
+    that spend nothing. One record adds 1 to at most every counter, so
+    node noise is Laplace(len(names) * levels / epsilon) and a whole tree
+    costs epsilon once, charged when it starts. After `horizon` steps a
+    new tree starts from the last released values and is charged again.
+    """
+
+    def __init__(self, names: Sequence[str], epsilon: float, horizon: int = 2 ** 24, store=None,
+                 charge: Callable[[float], float] = None, rng=None):
+        if epsilon <= 0 or horizon < 1:
+            raise ValueError("Epsilon and horizon must be positive")
+        self.names = list(names)
+        self.epsilon = epsilon
+        self.horizon = horizon
+        self.levels = horizon.bit_length()
+        self.scale = len(self.names) * self.levels / epsilon
+        self.store = store if store is not None else MemoryTreeStore()
+        self.charge = charge
+        self.rng = rng
+
+    def add(self, counts: Dict[str, float]):
+        """Append one time step; raises ValueError if a new tree cannot be paid for"""
+        x = np.array([counts.get(name, 0) for name in self.names], dtype=float)
+        self.store.transact(lambda state: self._step(state, x))
+
+    def read(self) -> Dict:
+        """Current released counts; free to call as often as needed"""
+        state = self.store.load()
+        if state is None:
+            return {"steps": 0, "trees": 0, "counts": dict.fromkeys(self.names, 0.0), "nodes": 0}
+        released, nodes = _released(state)
+        return {
+            "steps": state["steps"],
+            "trees": state["trees"],
+            "counts": dict(zip(self.names, released.tolist())),
+            "nodes": nodes
+        }
+
+    def accuracy(self, nodes: int, alpha: float = 0.05) -> float:
+        """Approximate (1 - alpha) half-width of a released count summing `nodes` Laplace draws"""
+        if nodes <= 0:
+            return 0.0
+        if nodes == 1:
+            return self.scale * math.log(1 / alpha)
+        # Normal approximation to the sum; each draw has variance 2 * scale^2
+        z = {0.05: 1.96, 0.01: 2.576}.get(alpha, 1.96)
+        return z * self.scale * math.sqrt(2 * nodes)
+
+    def _step(self, state: Optional[State], x: np.ndarray) -> State:
+        if state is None or state["t"] >= self.horizon or len(state["noisy"]) != self.levels:
+            state = self._new_tree(state)
+        t = state["t"] + 1
+        exact = state["exact"].copy()
+        noisy = state["noisy"].copy()
+        level = (t & -t).bit_length() - 1
+        if level:
+            exact[level] = exact[:level].sum(axis=0) + x
+            exact[:level] = 0.0
+            noisy[:level] = 0.0
+        else:
+            exact[0] = x
+        noisy[level] = exact[level] + laplace_noise(x.shape, self.scale, self.rng)
+        return {**state, "t": t, "steps": state["steps"] + 1, "exact": exact, "noisy": noisy}
+
+    def _new_tree(self, state: Optional[State]) -> State:
+        if self.charge is not None:
+            self.charge(self.epsilon)
+        k = len(self.names)
+        if state is None:
+            state = {"steps": 0, "trees": 0, "base": np.zeros(k), "base_nodes": 0}
+        else:
+            # Start from the finished tree's final release; reusing it is post-processing
+            base, base_nodes = _released(state)
+            state = {**state, "base": base, "base_nodes": base_nodes}
+        return {
+            **state,
+            "t": 0,
+            "trees": state["trees"] + 1,
+            "exact": np.zeros((self.levels, k)),
+            "noisy": np.zeros((self.levels, k)),
+        }
+
+def _released(state: State):
+    """(released counts, number of noisy nodes summed into them)"""
+    t = state["t"]
+    levels = [j for j in range(len(state["noisy"])) if t >> j & 1]
+    return state["base"] + state["noisy"][levels].sum(axis=0), state["base_nodes"] + len(levels)
+
+def _continual_counters_from_env() -> Optional[BinaryTreeCounters]:
+    if CONTINUAL_RELEASE_EPSILON <= 0:
+        return None
+    return BinaryTreeCounters(
+        names=("total", *RISK_TYPES),
+        epsilon=CONTINUAL_RELEASE_EPSILON,
+        horizon=CONTINUAL_RELEASE_HORIZON,
+        store=SQLiteTreeStore(CONTINUAL_RELEASE_PATH) if CONTINUAL_RELEASE_PATH else MemoryTreeStore(),
+        charge=accountant.allocate_budget
+    )
+
+continual_counters = _continual_counters_from_env()
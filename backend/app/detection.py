@@ -0,0 +1,213 @@
+import re
+from collections import deque
+from typing import Dict, List, Sequence, Set, Tuple
+
+# Category labels used as automaton outputs
+BIAS = 0
+INJECTION = 1
+
+
+class TermAutomaton:
+    """Aho-Corasick automaton over a fixed set of lowercase literal terms.
+
+    Each term is tagged with (category, index) so that a single scan over the
+    text reports every BIAS and INJECTION term that occurs in it, regardless of
+    how many terms are loaded.
+    """
+
+    def __init__(self, terms: Sequence[Tuple[int, int, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[Tuple[int, int], ...]] = [()]
+
+        for category, index, term in terms:
+            if not term:
+                continue
+            state = 0
+            for ch in term:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = nxt
+            self._out[state] = self._out[state] + ((category, index),)
+
+        # Breadth-first construction of failure links; outputs of the failure
+        # target are merged in so the scan never has to walk output chains.
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                if self._out[self._fail[nxt]]:
+                    self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, text: str, state: int = 0, found: Set[Tuple[int, int]] = None):
+        """Feed text through the automaton, returning (state, found outputs)"""
+        if found is None:
+            found = set()
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        root = goto[0]
+        for ch in text:
+            if state == 0:
+                state = root.get(ch, 0)
+            else:
+                nxt = goto[state].get(ch)
+                while nxt is None and state:
+                    state = fail[state]
+                    nxt = goto[state].get(ch)
+                state = nxt or 0
+            if out[state]:
+                found.update(out[state])
+        return state, found
+
+
+class StreamScan:
+    """Detection state for one prompt fed to Detector.feed() chunk by chunk.
+
+    Holds no reference to the Detector, so it stays small and cheap to pickle
+    to a worker process between chunks. Memory is bounded by the rule lists,
+    the PII carry and STREAM_PII_SAMPLE, not by the prompt length.
+    """
+
+    __slots__ = ("rules_version", "state", "term_tail", "found", "carry", "pii_count", "pii_sample", "chars")
+
+    def __init__(self, rules_version: str, found: Set[Tuple[int, int]] = ()):
+        # The scan state is only meaningful to the Detector with this version
+        self.rules_version = rules_version
+        self.state = 0
+        self.term_tail = ""
+        self.found = set(found)
+        self.carry = ""
+        self.pii_count = 0
+        self.pii_sample: List[str] = []
+        self.chars = 0
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+class Detector:
+    """Compiled, immutable matcher for the PII, BIAS and INJECTION rule lists.
+
+    Small term lists are checked with C-level substring search, which beats a
+    Python-level automaton walk; past AUTOMATON_MIN_TERMS the automaton keeps
+    per-prompt cost flat no matter how many terms are loaded.
+    """
+
+    AUTOMATON_MIN_TERMS = 64
+    # Most unmatched text kept between streamed chunks for the PII regex;
+    # a match that runs across the cut in a longer run without whitespace
+    # is counted as it stands at the cut, and sampled at most this long
+    STREAM_CARRY_CHARS = 1024
+    # Distinct PII matches kept per streamed prompt (reports show three)
+    STREAM_PII_SAMPLE = 3
+
+    def __init__(self, pii_regex: str, bias_terms: Sequence[str], injection_patterns: Sequence[str],
+                 version: str = "builtin"):
+        self.version = version
+        self.pii_pattern = re.compile(pii_regex)
+        self.bias_terms = tuple(bias_terms)
+        self.injection_patterns = tuple(injection_patterns)
+        tagged = (
+            [(BIAS, i, term) for i, term in enumerate(self.bias_terms)] +
+            [(INJECTION, i, patt) for i, patt in enumerate(self.injection_patterns)]
+        )
+        self.automaton = TermAutomaton(tagged)
+        self.use_automaton = len(tagged) >= self.AUTOMATON_MIN_TERMS
+        # An empty term is a substring of every prompt
+        self._always = frozenset((c, i) for c, i, term in tagged if not term)
+        self._tagged = [(c, i, term) for c, i, term in tagged if term]
+        self._max_term_len = max((len(term) for _, _, term in tagged), default=0)
+
+    def detect(self, prompt: str) -> Tuple[List[str], List[str], List[str]]:
+        """Return (pii matches, bias terms, injection patterns) found in prompt.
+
+        Term lists keep rule-list order, matching the per-term `in` checks
+        this detector replaces.
+        """
+        pii_matches = self.pii_pattern.findall(prompt)
+        lower_prompt = prompt.lower()
+        if not self.use_automaton:
+            return (
+                pii_matches,
+                [term for term in self.bias_terms if term in lower_prompt],
+                [patt for patt in self.injection_patterns if patt in lower_prompt]
+            )
+        _, found = self.automaton.scan(lower_prompt, found=set(self._always))
+        return pii_matches, self._ordered(found, BIAS), self._ordered(found, INJECTION)
+
+    def _ordered(self, found: Set[Tuple[int, int]], category: int) -> List[str]:
+        terms = self.bias_terms if category == BIAS else self.injection_patterns
+        return [terms[i] for i in sorted(i for c, i in found if c == category)]
+
+    def stream(self) -> StreamScan:
+        """Start an incremental scan; feed it chunks with feed()"""
+        return StreamScan(self.version, self._always)
+
+    def feed(self, scan: StreamScan, chunk: str, final: bool = False) -> StreamScan:
+        """Scan the next chunk of a streamed prompt, updating and returning scan.
+
+        Terms that straddle chunk boundaries are found through the carried
+        automaton state (or a tail of the previous chunk for short lists).
+        PII text is cut at the last whitespace and the remainder carried
+        into the next chunk, which is exact as long as PII matches contain
+        no whitespace (RulePack rejects patterns that can match it). The
+        carry never exceeds STREAM_CARRY_CHARS. Pass final=True with the
+        last chunk to flush the carry.
+        """
+        scan.chars += len(chunk)
+        lower_chunk = chunk.lower()
+        if self.use_automaton:
+            scan.state, _ = self.automaton.scan(lower_chunk, scan.state, scan.found)
+        else:
+            text = scan.term_tail + lower_chunk
+            scan.found.update((c, i) for c, i, term in self._tagged if term in text)
+            keep = self._max_term_len - 1
+            scan.term_tail = text[-keep:] if keep > 0 else ""
+
+        text = scan.carry + chunk
+        if final:
+            cut = len(text)
+        else:
+            cut = max(0, *(text.rfind(ch) for ch in " \t\n\r\f\v"))
+            if cut < len(text) - self.STREAM_CARRY_CHARS:
+                # No usable whitespace: cut hard. A match running across the cut
+                # is counted up to where it reaches now; moving the cut back to
+                # its start would let the carry grow with the body
+                cut = len(text) - self.STREAM_CARRY_CHARS
+                for match in self.pii_pattern.finditer(text):
+                    if match.end() > cut:
+                        if match.start() < cut:
+                            cut = match.end()
+                        break
+        for match in self.pii_pattern.findall(text[:cut]):
+            scan.pii_count += 1
+            match = match[:self.STREAM_CARRY_CHARS]
+            if len(scan.pii_sample) < self.STREAM_PII_SAMPLE and match not in scan.pii_sample:
+                scan.pii_sample.append(match)
+        scan.carry = text[cut:]
+        return scan
+
+    def stream_result(self, scan: StreamScan) -> Tuple[List[str], int, List[str], List[str]]:
+        """Return (PII sample, PII count, bias terms, injection patterns) scanned so far"""
+        return (
+            list(scan.pii_sample),
+            scan.pii_count,
+            self._ordered(scan.found, BIAS),
+            self._ordered(scan.found, INJECTION)
+        )
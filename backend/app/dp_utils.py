@@ -1,6 +1,8 @@
 from diffprivlib.mechanisms import Laplace
+from functools import lru_cache
 import numpy as np
 import math
+import os
 
 # --- Utility Functions ---
 
@@ -18,19 +20,81 @@ def clamp_val(value, min_val, max_val):
     """Clamp value between min and max"""
     return max(min_val, min(max_val, value))
 
+# --- Noise Generation ---
+
+@lru_cache(maxsize=256)
+def laplace_mechanism(epsilon: float, sensitivity: float = 1.0) -> Laplace:
+    """Shared Laplace mechanism for (epsilon, sensitivity).
+
+    Mechanisms draw from secrets.SystemRandom and hold no per-release state,
+    so one instance can serve every caller, including concurrent threads.
+    """
+    return Laplace(epsilon=epsilon, sensitivity=sensitivity)
+
+def uniforms(size: int, rng=None) -> np.ndarray:
+    """Uniform samples in [0, 1).
+
+    With rng=None the bits come from os.urandom, like diffprivlib's
+    SystemRandom; pass a seed or np.random.Generator for reproducible noise.
+    """
+    if rng is None:
+        bits = np.frombuffer(os.urandom(8 * size), dtype=np.uint64)
+        return (bits >> np.uint64(11)) * 2.0 ** -53
+    return np.random.default_rng(rng).random(size)
+
+def laplace_noise(shape, scale: float, rng=None) -> np.ndarray:
+    """Laplace(0, scale) noise of the given shape in one draw.
+
+    Uses the same four-uniform sampler as diffprivlib's Laplace mechanism.
+    """
+    size = int(np.prod(shape))
+    u = uniforms(4 * size, rng).reshape(4, size)
+    standard = np.log(1 - u[0]) * np.cos(np.pi * u[1]) + np.log(1 - u[2]) * np.cos(np.pi * u[3])
+    return (scale * standard).reshape(shape)
+
 # --- Privatization Functions ---
 
 def privatize_risk_score(value: float, epsilon=0.5) -> float:
     """Privatize risk score in [0.0, 1.0]"""
     safe_val = clamp_val(safe_float(value), 0.0, 1.0)
-    mech = Laplace(epsilon=epsilon, sensitivity=1.0)
-    return mech.randomise(safe_val)
+    # Clamping the release is post-processing and costs no extra budget
+    return clamp_val(laplace_mechanism(epsilon, 1.0).randomise(safe_val), 0.0, 1.0)
 
 def privatize_count(value: int, epsilon=0.1) -> float:
     """Privatize count in [0, 1_000_000]"""
     safe_val = clamp_val(safe_float(value), 0.0, 1_000_000.0)
-    mech = Laplace(epsilon=epsilon, sensitivity=1.0)
-    return mech.randomise(safe_val)
+    return laplace_mechanism(epsilon, 1.0).randomise(safe_val)
+
+def privatize_counts(values, epsilon=0.1, sensitivity=1.0, rng=None) -> np.ndarray:
+    """Privatize an array of counts in [0, 1_000_000], each with its own epsilon-DP release"""
+    if epsilon <= 0 or sensitivity <= 0:
+        raise ValueError("Epsilon and sensitivity must be positive")
+    safe_vals = np.nan_to_num(np.asarray(values, dtype=float), nan=0.0, posinf=0.0, neginf=0.0)
+    safe_vals = np.clip(safe_vals, 0.0, 1_000_000.0)
+    return safe_vals + laplace_noise(safe_vals.shape, sensitivity / epsilon, rng)
+
+# --- Post-processing ---
+
+def histogram_quantiles(counts, quantiles, low: float = 0.0, high: float = 1.0) -> np.ndarray:
+    """Quantiles of values binned evenly over [low, high] from a (noisy) histogram.
+
+    Negative counts are clipped to zero, then each quantile is read off the
+    cumulative counts, interpolating linearly inside its bin. Works on a
+    released histogram, so it is post-processing and costs no budget.
+    Returns NaN for every quantile when no mass is left.
+    """
+    counts = np.clip(np.nan_to_num(np.asarray(counts, dtype=float)), 0.0, None)
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1] if len(cumulative) else 0.0
+    if total <= 0:
+        return np.full(len(quantiles), np.nan)
+    targets = np.clip(np.asarray(quantiles, dtype=float), 0.0, 1.0) * total
+    # First bin whose cumulative count reaches each target
+    bins = np.minimum(np.searchsorted(cumulative, targets, side="left"), len(counts) - 1)
+    before = cumulative[bins] - counts[bins]
+    fraction = np.divide(targets - before, counts[bins], out=np.zeros(len(targets)), where=counts[bins] > 0)
+    width = (high - low) / len(counts)
+    return low + (bins + np.clip(fraction, 0.0, 1.0)) * width
 
 # --- Accuracy Estimation (Optional) ---
 
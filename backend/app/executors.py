@@ -0,0 +1,76 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from app.metrics import metrics
+
+# Executor sizing
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_MAX_PENDING = int(os.getenv("ANALYSIS_MAX_PENDING", "64"))
+ANALYSIS_INLINE_MAX_CHARS = int(os.getenv("ANALYSIS_INLINE_MAX_CHARS", "4096"))
+ANALYSIS_WORKER_NICE = int(os.getenv("ANALYSIS_WORKER_NICE", "10"))
+DB_WORKERS = int(os.getenv("DB_WORKERS", "16"))
+
+def _init_analysis_worker():
+    """Deprioritize worker processes so the event loop wins contended CPUs"""
+    if ANALYSIS_WORKER_NICE and hasattr(os, "nice"):
+        os.nice(ANALYSIS_WORKER_NICE)
+
+# Detection is pure-Python/regex work that holds the GIL, so it runs in worker
+# processes; a thread pool would still stall the event loop on every GIL
+# handoff. Blocking pymongo calls release the GIL and use threads.
+analysis_executor = ProcessPoolExecutor(
+    max_workers=ANALYSIS_WORKERS,
+    mp_context=multiprocessing.get_context("spawn"),
+    initializer=_init_analysis_worker
+)
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="mongo")
+
+_pending = {}
+# Offloaded analysis jobs queued or running, for the queue-depth gauge
+analysis_in_flight = 0
+
+def _pending_slots() -> asyncio.Semaphore:
+    """Semaphore bounding queued analysis work, one per running event loop"""
+    loop = asyncio.get_running_loop()
+    slots = _pending.get(loop)
+    if slots is None:
+        _pending.clear()
+        slots = _pending[loop] = asyncio.Semaphore(ANALYSIS_MAX_PENDING)
+    return slots
+
+async def run_analysis(fn: Callable, *args, size: int = None) -> Any:
+    """Run CPU-bound detection off the event loop.
+
+    fn and its arguments must be picklable. Work smaller than
+    ANALYSIS_INLINE_MAX_CHARS runs inline since a process hop costs more
+    than the scan itself. At most ANALYSIS_MAX_PENDING jobs are
+    queued; further callers wait for a slot.
+    """
+    global analysis_in_flight
+    if size is not None and size <= ANALYSIS_INLINE_MAX_CHARS:
+        return fn(*args)
+    analysis_in_flight += 1
+    try:
+        async with _pending_slots():
+            return await asyncio.get_running_loop().run_in_executor(analysis_executor, partial(fn, *args))
+    finally:
+        analysis_in_flight -= 1
+
+def _timed_db_call(fn: Callable, *args, **kwargs) -> Any:
+    # Timed on the worker thread, so pool queueing is not counted
+    with metrics.timer("db_operation_seconds", operation=fn.__name__):
+        return fn(*args, **kwargs)
+
+async def run_db(fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking pymongo call on the database thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(
+        db_executor, partial(_timed_db_call, fn, *args, **kwargs)
+    )
+
+def db_queue_depth() -> int:
+    """Database calls waiting for a free thread"""
+    return db_executor._work_queue.qsize()
@@ -0,0 +1,37 @@
+import hashlib
+import logging
+import os
+import secrets
+
+from app.shared_state import shared_secret
+
+logger = logging.getLogger(__name__)
+
+PROMPT_HASH_SECRET = os.getenv("PROMPT_HASH_SECRET")
+PROMPT_HASH_SIZE = 16
+
+if PROMPT_HASH_SECRET:
+    # BLAKE2b keys are at most 64 bytes; longer secrets are hashed down
+    _key = PROMPT_HASH_SECRET.encode("utf-8")
+    if len(_key) > hashlib.blake2b.MAX_KEY_SIZE:
+        _key = hashlib.blake2b(_key).digest()
+else:
+    # Workers sharing SHARED_STATE_DIR generate one key and keep it in the directory
+    _key = shared_secret("prompt_hash.key")
+    if _key is None:
+        logger.warning("PROMPT_HASH_SECRET is not set; prompt hashes will differ between processes and restarts")
+        _key = secrets.token_bytes(32)
+
+def prompt_hasher():
+    """Keyed BLAKE2b for incrementally hashing a prompt's UTF-8 bytes"""
+    return hashlib.blake2b(key=_key, digest_size=PROMPT_HASH_SIZE)
+
+def prompt_digest(prompt: str) -> str:
+    """Stable keyed digest of a prompt, stored in place of the prompt itself.
+
+    Without the server secret the digest cannot be recomputed from a
+    guessed prompt, so stored hashes do not confirm prompt contents.
+    """
+    hasher = prompt_hasher()
+    hasher.update(prompt.encode("utf-8", errors="surrogatepass"))
+    return hasher.hexdigest()
@@ -1,69 +1,570 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from app.analysis import analyze_prompt
-from app.database import save_analysis, get_dp_analytics
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Any, AsyncIterator, Dict, List, Optional
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from app.analysis import (
+    analyze_prompt, analyze_batch, start_stream, feed_stream, stream_risk_score, finish_stream,
+    active_detector, refresh_rules, set_rules_watched, RulesChanged
+)
+from app.rules import RULES_PATH, RULES_POLL_INTERVAL
+from app.database import (
+    save_analysis, save_analyses, get_dp_analytics, get_dp_rollups, analysis_record, ensure_indexes,
+    bucket_start, ROLLUP_GRANULARITIES, MAX_ANALYTICS_BUCKETS, MONGO_ENSURE_INDEXES, RISK_TYPES, RISK_SCORE_EPSILON
+)
 from app.privacy_accountant import accountant
+from app.user_budgets import user_budgets, USER_BUDGET_FLUSH_INTERVAL
+from app.continual import continual_counters
+from app.sketches import risk_sketches, ANALYTICS_SKETCH_EPSILON, SKETCH_FLUSH_INTERVAL, TERM_TYPES
+from app.analytics_cache import analytics_cache
+from app.hashing import prompt_digest, prompt_hasher
+from app.result_cache import result_cache
+from app.metrics import metrics, RequestMetricsMiddleware, WorkerMetrics, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL
+from app.profiling import ProfileMiddleware
+from app.responses import encoded, ndjson, preferred, formats, MSGPACK, NDJSON, NDJSON_CHUNK_SIZE
+from app.shared_state import SHARED_STATE_DIR
+from app import executors
+from app.executors import run_analysis, run_db
+from app.write_behind import write_behind, WRITE_BEHIND_ENABLED
+from pymongo.errors import PyMongoError
+import asyncio
+import codecs
+import logging
 import os
+import secrets
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+MAX_PROMPT_BYTES = int(os.getenv("MAX_PROMPT_BYTES", str(16 * 1024 * 1024)))
+# Stop reading a streamed prompt once its risk score reaches 1.0
+STREAM_EARLY_EXIT = os.getenv("STREAM_EARLY_EXIT", "true").lower() in ("1", "true", "yes")
+# Enables the /admin endpoints when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Lets admins profile single requests with X-Profile: 1 (needs ADMIN_TOKEN)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+async def watch_rules():
+    """Poll RULES_PATH and swap in a changed pack, compiling it off the event loop"""
+    while True:
+        await asyncio.sleep(RULES_POLL_INTERVAL)
+        try:
+            await asyncio.to_thread(refresh_rules)
+        except ValueError:
+            pass  # logged by the rule source; the current pack stays active
+
+async def flush_user_budgets():
+    """Persist changed per-user spending off the event loop"""
+    while True:
+        await asyncio.sleep(USER_BUDGET_FLUSH_INTERVAL)
+        await asyncio.to_thread(user_budgets.flush)
+
+async def flush_sketches():
+    """Fold this worker's sketch updates into the shared store"""
+    while True:
+        await asyncio.sleep(SKETCH_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(risk_sketches.flush)
+        except sqlite3.Error as e:
+            logger.error("Could not flush analytics sketches: %s", e)
+
+async def publish_metrics():
+    """Keep this worker's metrics snapshot fresh for scrapes served by other workers"""
+    while True:
+        await asyncio.to_thread(worker_metrics.write)
+        await asyncio.sleep(METRICS_SNAPSHOT_INTERVAL)
+
+async def create_indexes():
+    """Ensure MongoDB indexes without holding up startup while the server is unreachable"""
+    try:
+        await run_db(ensure_indexes)
+    except PyMongoError as e:
+        # Serve anyway; queries still work, only slower, until indexes exist
+        logger.error("Could not ensure MongoDB indexes: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    indexer = asyncio.create_task(create_indexes()) if MONGO_ENSURE_INDEXES else None
+    if WRITE_BEHIND_ENABLED:
+        await write_behind.start()
+    watcher = None
+    if RULES_PATH:
+        # Requests never compile a pack on the event loop; the watcher does it in a thread
+        set_rules_watched()
+        try:
+            await asyncio.to_thread(refresh_rules)
+        except ValueError:
+            pass  # logged by the rule source; serve the built-in rules until it is fixed
+        watcher = asyncio.create_task(watch_rules())
+    flusher = asyncio.create_task(flush_user_budgets()) if user_budgets is not None else None
+    publisher = asyncio.create_task(publish_metrics()) if worker_metrics is not None else None
+    sketcher = asyncio.create_task(flush_sketches()) if risk_sketches is not None else None
+    yield
+    if indexer is not None:
+        indexer.cancel()
+    if sketcher is not None:
+        sketcher.cancel()
+        risk_sketches.flush()
+    if publisher is not None:
+        publisher.cancel()
+        worker_metrics.remove()
+    if watcher is not None:
+        watcher.cancel()
+        set_rules_watched(False)
+    if flusher is not None:
+        flusher.cancel()
+        user_budgets.flush()
+    # Flush buffered records before the worker exits
+    await write_behind.stop()
+    accountant.release_lease()
 
 app = FastAPI(
     title="Privacy-Preserving Prompt Analysis API",
     description="API for analyzing LLM prompts with differential privacy",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    # Handlers that return plain dicts still skip stdlib json
+    default_response_class=ORJSONResponse
 )
 
+def _profile_authorized(headers: Dict[str, str]) -> bool:
+    token = headers.get("x-admin-token")
+    return bool(PROFILING_ENABLED and ADMIN_TOKEN and token and secrets.compare_digest(token, ADMIN_TOKEN))
+
+# Every worker sharing METRICS_DIR reports host-wide totals on /metrics
+worker_metrics = WorkerMetrics(metrics, METRICS_DIR, METRICS_SNAPSHOT_INTERVAL) if METRICS_DIR else None
+
+app.add_middleware(ProfileMiddleware, authorize=_profile_authorized)
+app.add_middleware(RequestMetricsMiddleware)
+
+@metrics.collector
+def _collect_gauges(registry):
+    registry.set("privacy_budget_epsilon_total", accountant.global_budget)
+    registry.set("privacy_budget_epsilon_used", accountant.used_epsilon)
+    registry.set("privacy_budget_epsilon_remaining", accountant.remaining_budget)
+    registry.set("analysis_jobs_in_flight", executors.analysis_in_flight)
+    if user_budgets is not None:
+        registry.set("user_budgets_resident", user_budgets.resident)
+    registry.set("db_executor_queue_depth", executors.db_queue_depth())
+    if write_behind.running:
+        registry.set("write_behind_queue_depth", write_behind.depth)
+
+def check_prompt_size(prompt: str) -> str:
+    """Reject prompts over MAX_PROMPT_BYTES once UTF-8 encoded"""
+    # A character takes at most 4 bytes, so most prompts skip the encode
+    if len(prompt) * 4 > MAX_PROMPT_BYTES and (
+            len(prompt) > MAX_PROMPT_BYTES or len(prompt.encode("utf-8", "surrogatepass")) > MAX_PROMPT_BYTES):
+        raise ValueError(f"Prompt exceeds {MAX_PROMPT_BYTES} bytes")
+    return prompt
+
+Prompt = Annotated[str, AfterValidator(check_prompt_size)]
+
 class PromptRequest(BaseModel):
-    prompt: str
+    prompt: Prompt
+    user_id: str = "anonymous"
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[Prompt] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
     user_id: str = "anonymous"
 
-@app.post("/analyze")
-async def analyze_prompt_endpoint(request: PromptRequest):
+# Response models document the schemas. Handlers return pre-encoded
+# responses (app.responses), so FastAPI neither validates nor re-encodes them.
+class AnalysisResult(BaseModel):
+    risk_score: float
+    risk_factors: List[Dict[str, Any]]
+    suggestions: List[str]
+    needs_review: bool
+
+class AnalysisResponse(AnalysisResult):
+    privacy_guarantee: str
+
+class StreamAnalysisResponse(AnalysisResponse):
+    truncated: bool
+    scanned_bytes: int
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[AnalysisResult]
+    privacy_guarantee: str
+
+# Alternative encodings offered to clients through the Accept header
+ENCODINGS = {200: {"content": {MSGPACK: {}}}}
+STREAM_ENCODINGS = {200: {"content": {MSGPACK: {}, NDJSON: {
+    "schema": {"description": "One AnalysisResult per line in prompt order, then {\"privacy_guarantee\": ...}"}
+}}}}
+
+def analysis_result(analysis: Dict) -> Dict:
+    return {
+        "risk_score": analysis["raw_risk"],
+        "risk_factors": analysis["risk_factors"],
+        "suggestions": analysis["suggestions"],
+        "needs_review": analysis["needs_review"]
+    }
+
+async def allocate_budget(user_id: str, epsilon: float) -> float:
+    """Charge the user's budget, then the global one; ValueError if either is exhausted.
+
+    Both charges can wait on a SQLite write lock, so they run in a thread.
+    """
+    if user_budgets is None:
+        return await asyncio.to_thread(accountant.allocate_budget, epsilon)
+    await asyncio.to_thread(user_budgets.charge, user_id, epsilon)
+    try:
+        return await asyncio.to_thread(accountant.allocate_budget, epsilon)
+    except ValueError:
+        await asyncio.to_thread(user_budgets.refund, user_id, epsilon)
+        raise
+
+async def persist(items: List[Dict]):
+    """Save analyses directly, or hand them to the write-behind buffer"""
+    await analytics_cache.note_records_async(len(items))
+    metrics.inc("analyses_total", len(items))
+    for risk_type, count in Counter(f["type"] for data in items for f in data["risk_factors"]).items():
+        metrics.inc("risk_factors_total", count, type=risk_type)
+    if continual_counters is not None:
+        await add_continual_step(items)
+    if risk_sketches is not None:
+        risk_sketches.add(items)
+    if not write_behind.running:
+        if len(items) == 1:
+            await run_db(save_analysis, items[0])
+        else:
+            await run_db(save_analyses, items)
+        return
+    for data in items:
+        await write_behind.put(analysis_record(data))
+
+async def add_continual_step(items: List[Dict]):
+    """Append one time step to the continually released counters"""
+    counts = Counter({"total": len(items)})
+    for data in items:
+        # Like risk_counters, a record counts once per risk type
+        counts.update({f["type"] for f in data["risk_factors"]})
+    try:
+        await asyncio.to_thread(continual_counters.add, counts)
+    except ValueError as e:
+        # A new tree could not be paid for; the analyses are still stored
+        metrics.inc("continual_release_dropped_total", len(items))
+        logger.warning("Continual release skipped %d analyses: %s", len(items), e)
+
+async def analyze_cached(prompts: List[str], digests: List[str], endpoint: str) -> List[Dict]:
+    """Analyze prompts, reusing cached results for digests seen under the current rules"""
+    with metrics.timer("analysis_stage_seconds", endpoint=endpoint, stage="cache"):
+        analyses = await result_cache.lookup(active_detector().version, digests)
+    # Each distinct uncached prompt is analyzed once
+    missing = {}
+    for prompt, digest in zip(prompts, digests):
+        if digest not in analyses:
+            missing.setdefault(digest, prompt)
+    with metrics.timer("analysis_stage_seconds", endpoint=endpoint, stage="detection"):
+        if len(missing) == 1:
+            (digest, prompt), = missing.items()
+            fresh = {digest: await run_analysis(analyze_prompt, prompt, size=len(prompt))}
+        elif missing:
+            fresh = dict(zip(missing, await run_analysis(
+                analyze_batch, list(missing.values()), size=sum(len(p) for p in missing.values())
+            )))
+        else:
+            fresh = {}
+    with metrics.timer("analysis_stage_seconds", endpoint=endpoint, stage="cache"):
+        await result_cache.store(fresh)
+    analyses.update(fresh)
+    return [analyses[digest] for digest in digests]
+
+@app.post("/analyze", response_model=AnalysisResponse, responses=ENCODINGS)
+async def analyze_prompt_endpoint(request: PromptRequest, accept: Optional[str] = Header(None)):
     try:
         # Allocate privacy budget
-        epsilon = accountant.allocate_budget(0.5)
+        with metrics.timer("analysis_stage_seconds", endpoint="analyze", stage="budget"):
+            epsilon = await allocate_budget(request.user_id, 0.5)
         
         # Perform privacy-preserving analysis
-        analysis = analyze_prompt(request.prompt)
+        with metrics.timer("analysis_stage_seconds", endpoint="analyze", stage="hash"):
+            digest = prompt_digest(request.prompt)
+        analysis, = await analyze_cached([request.prompt], [digest], "analyze")
         
         # Save results with privacy guarantees
-        save_analysis({
-            "user_id": request.user_id,
-            "prompt_hash": hash(request.prompt),  # Store hash only
-            **analysis,
-            "epsilon_used": epsilon
-        })
+        with metrics.timer("analysis_stage_seconds", endpoint="analyze", stage="persist"):
+            await persist([{
+                "user_id": request.user_id,
+                "prompt_hash": digest,  # Store keyed hash only
+                **analysis,
+                "epsilon_used": epsilon
+            }])
         
-        return {
-            "risk_score": analysis["raw_risk"],
-            "risk_factors": analysis["risk_factors"],
-            "suggestions": analysis["suggestions"],
-            "needs_review": analysis["needs_review"],
+        return encoded({**analysis_result(analysis), "privacy_guarantee": f"ε={epsilon}"}, accept)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+
+@app.post("/analyze/batch", response_model=BatchAnalysisResponse, responses=STREAM_ENCODINGS)
+async def analyze_batch_endpoint(request: BatchPromptRequest, accept: Optional[str] = Header(None)):
+    """Analyze up to MAX_BATCH_SIZE prompts for one budget charge.
+
+    With Accept: application/x-ndjson, results are streamed one per line as
+    each chunk of NDJSON_CHUNK_SIZE prompts is analyzed and saved.
+    """
+    try:
+        # One budget charge covers the whole batch
+        with metrics.timer("analysis_stage_seconds", endpoint="batch", stage="budget"):
+            epsilon = await allocate_budget(request.user_id, 0.5)
+        
+        if preferred(accept, formats(streaming=True)) == NDJSON:
+            return ndjson(stream_batch(request, epsilon))
+        
+        analyses = await analyze_and_persist(request.prompts, request.user_id, epsilon)
+        return encoded({
+            "results": [analysis_result(analysis) for analysis in analyses],
             "privacy_guarantee": f"ε={epsilon}"
-        }
+        }, accept)
     except ValueError as e:
         raise HTTPException(status_code=403, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
 
-@app.get("/analytics")
-async def get_analytics():
+async def analyze_and_persist(prompts: List[str], user_id: str, epsilon: float) -> List[Dict]:
+    """Analyze part or all of a batch and save the analyses"""
+    with metrics.timer("analysis_stage_seconds", endpoint="batch", stage="hash"):
+        digests = [prompt_digest(prompt) for prompt in prompts]
+    analyses = await analyze_cached(prompts, digests, "batch")
+    
+    with metrics.timer("analysis_stage_seconds", endpoint="batch", stage="persist"):
+        await persist([
+            {
+                "user_id": user_id,
+                "prompt_hash": digest,  # Store keyed hash only
+                **analysis,
+                "epsilon_used": epsilon
+            }
+            for digest, analysis in zip(digests, analyses)
+        ])
+    return analyses
+
+async def stream_batch(request: BatchPromptRequest, epsilon: float) -> AsyncIterator[Dict]:
+    """NDJSON lines for a paid-for batch: one result per prompt, then the guarantee.
+
+    The status line has gone out by the time a chunk fails, so a failure is
+    reported as a final {"error": ...} line instead.
+    """
+    for start in range(0, len(request.prompts), NDJSON_CHUNK_SIZE):
+        try:
+            analyses = await analyze_and_persist(
+                request.prompts[start:start + NDJSON_CHUNK_SIZE], request.user_id, epsilon
+            )
+        except Exception as e:
+            logger.error("Batch stream failed after %d results: %s", start, e)
+            yield {"error": f"Analysis error: {str(e)}", "completed": start}
+            return
+        for analysis in analyses:
+            yield analysis_result(analysis)
+    yield {"privacy_guarantee": f"ε={epsilon}"}
+
+@app.post("/analyze/stream", response_model=StreamAnalysisResponse, responses=ENCODINGS)
+async def analyze_stream_endpoint(request: Request, user_id: str = "anonymous"):
+    """Analyze a UTF-8 text body, typically chunked, without buffering it.
+
+    Budget is charged after the body is scanned, so uploads rejected with
+    413 cost nothing. After an early exit the rest of the body is still
+    hashed, not scanned, so prompt_hash matches /analyze for the same text.
+    """
+    too_large = HTTPException(status_code=413, detail=f"Prompt exceeds {MAX_PROMPT_BYTES} bytes")
     try:
-        epsilon = accountant.allocate_budget(0.1)
-        analytics = get_dp_analytics(epsilon)
+        declared = request.headers.get("content-length")
+        if declared is not None and declared.isdigit() and int(declared) > MAX_PROMPT_BYTES:
+            raise too_large
+        
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        digest = prompt_hasher()
+        scan = start_stream()
+        received = scanned = 0
+        truncated = False
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > MAX_PROMPT_BYTES:
+                raise too_large
+            digest.update(chunk)
+            if truncated:
+                continue
+            scanned = received
+            text = decoder.decode(chunk)
+            with metrics.timer("analysis_stage_seconds", endpoint="stream", stage="detection"):
+                try:
+                    scan = await run_analysis(feed_stream, scan, text, size=len(text))
+                except RulesChanged:
+                    # The worker never saw this stream's pack; this process has it.
+                    # The chunk can be large, so it is still scanned off the event loop
+                    scan = await asyncio.to_thread(feed_stream, scan, text)
+            if STREAM_EARLY_EXIT and stream_risk_score(scan) >= 1.0:
+                truncated = True
+        tail = "" if truncated else decoder.decode(b"", final=True)
+        analysis = finish_stream(feed_stream(scan, tail, final=True))
+        
+        with metrics.timer("analysis_stage_seconds", endpoint="stream", stage="budget"):
+            epsilon = await allocate_budget(user_id, 0.5)
+        with metrics.timer("analysis_stage_seconds", endpoint="stream", stage="persist"):
+            await persist([{
+                "user_id": user_id,
+                "prompt_hash": digest.hexdigest(),  # Store keyed hash only
+                **analysis,
+                "epsilon_used": epsilon
+            }])
+        
+        return encoded({
+            **analysis_result(analysis),
+            "truncated": truncated,
+            "scanned_bytes": scanned,
+            "privacy_guarantee": f"ε={epsilon}"
+        }, request.headers.get("accept"))
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis error: {str(e)}")
+
+def term_vocabulary() -> List[tuple]:
+    """(type, term) for every term the active rule pack can match; public, so safe to query"""
+    detector = active_detector()
+    vocabulary = {"BIAS": detector.bias_terms, "INJECTION": detector.injection_patterns}
+    return [(risk_type, term) for risk_type in TERM_TYPES for term in vocabulary[risk_type]]
+
+@app.get("/analytics", responses=ENCODINGS)
+async def get_analytics(
+    accept: Optional[str] = Header(None),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    granularity: Optional[str] = None
+):
+    windowed = since is not None or until is not None or granularity is not None
+    # Keyed on the request as sent, so a default window is reused for the whole epoch
+    cache_key = (since, until, granularity)
+    if windowed:
+        # Stored timestamps are naive UTC
+        until = _as_naive_utc(until) if until else datetime.utcnow()
+        since = _as_naive_utc(since) if since else until - timedelta(days=1)
+        granularity = granularity or "hour"
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"granularity must be one of {', '.join(ROLLUP_GRANULARITIES)}"
+            )
+        if since >= until:
+            raise HTTPException(status_code=400, detail="since must be earlier than until")
+        n_buckets = -(-(until - bucket_start(since, granularity)) // ROLLUP_GRANULARITIES[granularity])
+        if n_buckets > MAX_ANALYTICS_BUCKETS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Window spans {n_buckets} {granularity} buckets; maximum is {MAX_ANALYTICS_BUCKETS}"
+            )
+    async def release():
+        if windowed:
+            epsilon = await asyncio.to_thread(accountant.allocate_budget, 0.1)
+            analytics = await run_db(get_dp_rollups, epsilon, since, until, granularity)
+        else:
+            # Optional parts join the all-time release; one allocation pays
+            # for all of them, so none is released if it fails
+            sketch_epsilon = ANALYTICS_SKETCH_EPSILON if risk_sketches is not None else 0.0
+            epsilon = await asyncio.to_thread(accountant.allocate_budget, 0.1 + RISK_SCORE_EPSILON + sketch_epsilon)
+            analytics = await run_db(get_dp_analytics, 0.1, RISK_SCORE_EPSILON)
+            if risk_sketches is not None:
+                analytics.update(
+                    await asyncio.to_thread(risk_sketches.release, ANALYTICS_SKETCH_EPSILON, term_vocabulary())
+                )
         return {
             **analytics,
             "epsilon_used": epsilon
         }
+    
+    try:
+        analytics, hit = await analytics_cache.get_or_release(cache_key, release)
     except ValueError as e:
         raise HTTPException(status_code=403, detail=str(e))
+    return encoded(analytics, accept, headers={"X-Analytics-Cache": "HIT" if hit else "MISS"})
 
-@app.get("/privacy-budget")
-async def get_privacy_budget():
+@app.get("/analytics/continual")
+async def get_continual_analytics():
+    """Counts released under continual observation: reads spend no budget"""
+    if continual_counters is None:
+        raise HTTPException(status_code=404, detail="Continual release is disabled; set CONTINUAL_RELEASE_EPSILON")
+    released = await asyncio.to_thread(continual_counters.read)
+    counts = released["counts"]
+    return {
+        "total_analyses": counts["total"],
+        "risk_counts": {risk_type: counts[risk_type] for risk_type in RISK_TYPES},
+        "steps": released["steps"],
+        "accuracy_95": f"±{continual_counters.accuracy(released['nodes']):.2f}",
+        "privacy_guarantee": f"ε={continual_counters.epsilon} per {continual_counters.horizon} steps",
+        "epsilon_spent": continual_counters.epsilon * released["trees"]
+    }
+
+def _as_naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+@app.get("/health")
+async def health():
     return {
+        "status": "ok",
+        "rules_version": active_detector().version,
+        "write_behind": write_behind.stats() if write_behind.running else None
+    }
+
+def _check_admin_token(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin endpoints are disabled")
+    if token is None or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/admin/rules/reload")
+async def reload_rules(x_admin_token: Optional[str] = Header(None)):
+    """Load RULES_PATH now instead of waiting for the watcher"""
+    _check_admin_token(x_admin_token)
+    if not RULES_PATH:
+        raise HTTPException(status_code=409, detail="RULES_PATH is not configured")
+    try:
+        reloaded = await asyncio.to_thread(refresh_rules, True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"rules_version": active_detector().version, "reloaded": reloaded}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Collectors read the privacy ledger, which may be waiting on a write lock
+    if worker_metrics is not None:
+        return await asyncio.to_thread(worker_metrics.render)
+    return await asyncio.to_thread(metrics.render)
+
+@app.get("/privacy-budget")
+async def get_privacy_budget(user_id: Optional[str] = None):
+    # A shared ledger read is a SQLite query; keep it off the event loop
+    used_epsilon = await asyncio.to_thread(lambda: accountant.used_epsilon)
+    budget = {
         "total_budget": accountant.global_budget,
-        "used_epsilon": accountant.used_epsilon,
-        "remaining_budget": accountant.remaining_budget
+        "used_epsilon": used_epsilon,
+        "remaining_budget": accountant.global_budget - used_epsilon,
+        "accountant": accountant.composition.name,
+        "delta": accountant.composition.delta
     }
+    if user_id is not None and user_budgets is not None:
+        used = await asyncio.to_thread(user_budgets.used, user_id)
+        budget["user"] = {
+            "user_id": user_id,
+            "total_budget": user_budgets.budget,
+            "used_epsilon": used,
+            "remaining_budget": max(0.0, user_budgets.budget - used),
+            "window_seconds": user_budgets.window,
+            "resets_at": datetime.fromtimestamp(user_budgets.window_resets_at(), timezone.utc).isoformat()
+        }
+    return budget
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and not SHARED_STATE_DIR:
+        # Each worker would otherwise keep its own privacy budget; see gunicorn.conf.py
+        raise SystemExit("WEB_CONCURRENCY > 1 needs SHARED_STATE_DIR")
+    uvicorn.run("app.main:app" if workers > 1 else app, host="0.0.0.0", port=8000, workers=workers)
\ No newline at end of file
@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from app.shared_state import shared_path
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+# METRICS_ENABLED=false turns every recording call into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds; covers sub-millisecond detection up to slow database calls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Where each worker publishes its metrics so /metrics covers all of them (unset = this process only)
+METRICS_DIR = os.getenv("METRICS_DIR") or shared_path("metrics")
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "1.0"))
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, n_buckets: int):
+        self.counts = [0] * (n_buckets + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+class Metrics:
+    """Process-local counters, gauges and histograms, exposed in Prometheus text format on /metrics.
+
+    Recording is a dict update under a lock, about a microsecond. Gauges
+    that mirror other objects' state are refreshed by collectors at scrape
+    time rather than on every change.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[LabelSet, float]] = defaultdict(dict)
+        self._gauges: Dict[str, Dict[LabelSet, float]] = defaultdict(dict)
+        self._histograms: Dict[str, Dict[LabelSet, _Histogram]] = defaultdict(dict)
+        self._collectors: List[Callable[["Metrics"], None]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0.0) + amount
+
+    def set(self, name: str, value: float, **labels: str):
+        """Set a gauge"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Record one sample in a histogram with LATENCY_BUCKETS"""
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(LATENCY_BUCKETS))
+            histogram.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram.sum += value
+            histogram.count += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels: str):
+        """Observe the wall time of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def collector(self, fn: Callable[["Metrics"], None]):
+        """Register fn(metrics) to refresh gauges before each render"""
+        self._collectors.append(fn)
+        return fn
+
+    def value(self, name: str, **labels: str) -> float:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.get(name) or self._gauges.get(name, {})
+            return series.get(key, 0.0)
+
+    def count(self, name: str, **labels: str) -> int:
+        """Number of samples recorded in a histogram"""
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+            return histogram.count if histogram else 0
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            collect(self)
+        with self._lock:
+            return _render(self._counters, self._gauges, self._histograms)
+
+    def snapshot(self) -> dict:
+        """Current values as JSON-serializable data, for merging with other workers"""
+        for collect in self._collectors:
+            collect(self)
+        with self._lock:
+            return {
+                "counters": [[name, labels, value] for name, series in self._counters.items()
+                             for labels, value in series.items()],
+                "gauges": [[name, labels, value] for name, series in self._gauges.items()
+                           for labels, value in series.items()],
+                "histograms": [[name, labels, h.counts, h.sum, h.count] for name, series in self._histograms.items()
+                               for labels, h in series.items()]
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+def _render(counters, gauges, histograms) -> str:
+    lines = []
+    for kind, families in (("counter", counters), ("gauge", gauges)):
+        for name in sorted(families):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(families[name].items()):
+                lines.append(f"{name}{_labels(labels)} {value:g}")
+    for name in sorted(histograms):
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in sorted(histograms[name].items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+def _label_set(labels) -> LabelSet:
+    return tuple(tuple(pair) for pair in labels)
+
+class WorkerMetrics:
+    """Metrics of every worker process on the host, merged into one exposition.
+
+    Each worker writes a snapshot of its registry to directory/<pid>.json
+    every snapshot_interval seconds and when it renders. Rendering sums
+    counters and histograms over all snapshots, so a scrape that reaches
+    any worker reports host-wide totals, up to one interval stale. Gauges
+    describe one process and get a worker label instead. Snapshots not
+    refreshed for 10 intervals belong to workers that exited; they are
+    ignored and removed, so their counts drop out of the sums, which
+    Prometheus treats like a counter reset.
+    """
+
+    def __init__(self, registry: Metrics, directory: str, snapshot_interval: float = 1.0, worker: str = None):
+        self.registry = registry
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.worker = worker or str(os.getpid())
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"{self.worker}.json")
+
+    def write(self):
+        """Publish this worker's snapshot; rename() makes it appear whole"""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def snapshots(self) -> Dict[str, dict]:
+        """worker -> snapshot for every live worker, this one included"""
+        self.write()
+        stale_before = time.time() - 10 * self.snapshot_interval
+        snapshots = {}
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.stat(path).st_mtime < stale_before:
+                    os.unlink(path)
+                    continue
+                with open(path) as f:
+                    snapshots[name[:-len(".json")]] = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue  # removed or replaced while reading
+        return snapshots
+
+    def render(self) -> str:
+        if not self.registry.enabled:
+            return self.registry.render()
+        counters = defaultdict(lambda: defaultdict(float))
+        gauges = defaultdict(dict)
+        histograms = defaultdict(dict)
+        for worker, snapshot in self.snapshots().items():
+            for name, labels, value in snapshot["counters"]:
+                counters[name][_label_set(labels)] += value
+            for name, labels, value in snapshot["gauges"]:
+                gauges[name][tuple(sorted(_label_set(labels) + (("worker", worker),)))] = value
+            for name, labels, counts, total, count in snapshot["histograms"]:
+                histogram = histograms[name].get(_label_set(labels))
+                if histogram is None:
+                    histogram = histograms[name][_label_set(labels)] = _Histogram(len(LATENCY_BUCKETS))
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+        return _render(counters, gauges, histograms)
+
+def _labels(labels: LabelSet) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class RequestMetricsMiddleware:
+    """ASGI middleware timing every HTTP request by handler and status.
+
+    A plain ASGI wrapper rather than BaseHTTPMiddleware, which would copy
+    each response body through an extra task.
+    """
+
+    def __init__(self, app, registry: "Metrics" = None):
+        self.app = app
+        self.metrics = registry or metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get("endpoint")
+            handler = getattr(endpoint, "__name__", "unmatched")
+            self.metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                                 handler=handler, status=status)
+
+metrics = Metrics(enabled=METRICS_ENABLED)
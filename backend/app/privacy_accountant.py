@@ -1,27 +1,178 @@
+import json
 import os
+import sqlite3
+import threading
+from typing import Callable, Dict
+
+from app.composition import BasicComposition, make_composition, privacy_costs
+from app.shared_state import shared_path
+
+Totals = Dict[str, float]
+
+# Leases are drawn down by repeated float subtraction; accept a final
+# request that the remainder misses only by rounding error
+_LEASE_TOLERANCE = 1 - 1e-9
+
+def _add(totals: Totals, costs: Totals, sign: float = 1.0) -> Totals:
+    merged = dict(totals)
+    for key, value in costs.items():
+        merged[key] = merged.get(key, 0.0) + sign * value
+    return merged
+
+class MemoryLedger:
+    """Process-local ledger of running privacy-cost totals"""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    @property
+    def totals(self) -> Totals:
+        return dict(self._totals)
+
+    @property
+    def used(self) -> float:
+        """Sum of reserved epsilons"""
+        return self._totals.get("epsilon", 0.0)
+
+    def reserve(self, costs: Totals, fits: Callable[[Totals], bool]) -> bool:
+        """Atomically add costs if the resulting totals still fit"""
+        with self._lock:
+            updated = _add(self._totals, costs)
+            if not fits(updated):
+                return False
+            self._totals = updated
+            return True
+
+    def release(self, costs: Totals):
+        """Return previously reserved costs"""
+        with self._lock:
+            self._totals = _add(self._totals, costs, sign=-1.0)
+
+class SQLiteLedger:
+    """Privacy-cost ledger in a local SQLite file, shared by every process using it.
+
+    Each reservation runs in a BEGIN IMMEDIATE transaction, which holds
+    SQLite's write lock from the read to the write, so concurrent threads
+    and processes can never push the totals past what `fits` allows.
+    """
+
+    def __init__(self, path: str, name: str = "global"):
+        self.path = path
+        self.name = name
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS ledger (name TEXT PRIMARY KEY, totals TEXT NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO ledger (name, totals) VALUES (?, '{}')", (name,))
+
+    @property
+    def totals(self) -> Totals:
+        with self._lock:
+            row = self._conn.execute("SELECT totals FROM ledger WHERE name = ?", (self.name,)).fetchone()
+        return json.loads(row[0])
+
+    @property
+    def used(self) -> float:
+        """Sum of reserved epsilons"""
+        return self.totals.get("epsilon", 0.0)
+
+    def reserve(self, costs: Totals, fits: Callable[[Totals], bool]) -> bool:
+        """Atomically add costs if the resulting totals still fit"""
+        return self._update(costs, fits)
+
+    def release(self, costs: Totals):
+        """Return previously reserved costs"""
+        self._update({key: -value for key, value in costs.items()}, None)
+
+    def _update(self, costs: Totals, fits) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT totals FROM ledger WHERE name = ?", (self.name,)).fetchone()
+                updated = _add(json.loads(row[0]), costs)
+                if fits is not None and not fits(updated):
+                    self._conn.execute("ROLLBACK")
+                    return False
+                self._conn.execute("UPDATE ledger SET totals = ? WHERE name = ?", (json.dumps(updated), self.name))
+                self._conn.execute("COMMIT")
+                return True
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
 
 class PrivacyAccountant:
-    def __init__(self, global_budget: float = 10.0):
+    def __init__(self, global_budget: float = 10.0, ledger=None, lease_size: float = 0.0,
+                 composition: BasicComposition = None):
         self.global_budget = global_budget
-        self.used_epsilon = 0.0
-    
+        self.ledger = ledger if ledger is not None else MemoryLedger()
+        self.composition = composition if composition is not None else BasicComposition()
+        # Costs reserved from the ledger ahead of time and not yet handed
+        # out; with lease_size > 0 most allocations never touch the ledger
+        self.lease_size = lease_size
+        self._lease = {}
+        self._lock = threading.Lock()
+
+    @property
+    def used_epsilon(self) -> float:
+        # Other processes' unspent leases count as used: they may be spent
+        return self.composition.spent(_add(self.ledger.totals, self._lease, sign=-1.0))
+
     @property
     def remaining_budget(self) -> float:
         return self.global_budget - self.used_epsilon
-    
+
     def allocate_budget(self, requested_epsilon: float) -> float:
         """Allocate privacy budget with checks"""
         if requested_epsilon <= 0:
             raise ValueError("Epsilon must be positive")
-        
-        if self.remaining_budget < requested_epsilon:
-            raise ValueError(
-                f"Privacy budget exceeded. Requested: {requested_epsilon}, "
-                f"Available: {self.remaining_budget:.2f}"
-            )
-        
-        self.used_epsilon += requested_epsilon
-        return requested_epsilon
+
+        costs = privacy_costs(requested_epsilon)
+        with self._lock:
+            if all(self._lease.get(key, 0.0) >= value * _LEASE_TOLERANCE for key, value in costs.items()):
+                self._lease = _add(self._lease, costs, sign=-1.0)
+                return requested_epsilon
+
+            # Hand back whatever is left of the old lease so it is not stranded
+            if any(value > 0 for value in self._lease.values()):
+                self.ledger.release(self._lease)
+            self._lease = {}
+
+            # Reserve enough for lease_size worth of requests like this one
+            batch = max(1.0, self.lease_size / requested_epsilon)
+            reserved = {key: value * batch for key, value in costs.items()}
+            if not self.ledger.reserve(reserved, self._fits):
+                # A full lease may not fit even though the request does
+                reserved = costs
+                if not self.ledger.reserve(reserved, self._fits):
+                    raise ValueError(
+                        f"Privacy budget exceeded. Requested: {requested_epsilon}, "
+                        f"Available: {self.remaining_budget:.2f}"
+                    )
+            self._lease = {key: max(0.0, value) for key, value in _add(reserved, costs, sign=-1.0).items()}
+            return requested_epsilon
+
+    def release_lease(self):
+        """Hand unspent leased costs back to the shared ledger"""
+        with self._lock:
+            if any(self._lease.values()):
+                self.ledger.release(self._lease)
+            self._lease = {}
+
+    def _fits(self, totals: Totals) -> bool:
+        return self.composition.spent(totals) <= self.global_budget
+
+def _ledger_from_env():
+    path = os.getenv("PRIVACY_LEDGER_PATH") or shared_path("ledger.db")
+    return SQLiteLedger(path) if path else MemoryLedger()
 
 # Initialize global privacy accountant
-accountant = PrivacyAccountant(global_budget=float(os.getenv("PRIVACY_BUDGET", "10.0")))
\ No newline at end of file
+accountant = PrivacyAccountant(
+    global_budget=float(os.getenv("PRIVACY_BUDGET", "10.0")),
+    ledger=_ledger_from_env(),
+    lease_size=float(os.getenv("PRIVACY_LEASE_SIZE", "0.0")),
+    composition=make_composition(
+        os.getenv("PRIVACY_ACCOUNTANT", "basic"),
+        delta=float(os.getenv("PRIVACY_DELTA", "1e-6"))
+    )
+)
@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import uuid
+from collections import Counter
+from typing import Optional
+
+# Where profiles requested with the X-Profile header are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/prompt-analysis-profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+class SamplingProfiler:
+    """Samples the Python stacks of every thread in this process at a fixed interval.
+
+    Stacks are aggregated in collapsed ("folded") form, one line per
+    distinct stack with its sample count, ready for flamegraph.pl or
+    speedscope. Sampling runs in its own thread and costs nothing when no
+    profiler is active. Work offloaded to the detection worker processes
+    is not visible here; only the time spent waiting for it is.
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+    def save(self, directory: str = PROFILE_DIR, profile_id: Optional[str] = None) -> str:
+        """Write the folded stacks to directory; returns the profile id"""
+        profile_id = profile_id or uuid.uuid4().hex
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{profile_id}.folded"), "w") as f:
+            f.write(self.folded())
+        return profile_id
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names[ident] = next(
+                        (t.name for t in threading.enumerate() if t.ident == ident), str(ident)
+                    )
+                self.samples[names[ident] + ";" + ";".join(reversed(stack))] += 1
+
+class ProfileMiddleware:
+    """Profiles requests that carry an X-Profile header.
+
+    authorize(headers) decides whether the caller may profile. The profile
+    id is returned in the X-Profile-Id response header, and the stacks are
+    saved as PROFILE_DIR/<id>.folded.
+    """
+
+    def __init__(self, app, authorize, directory: str = None, interval: float = None):
+        self.app = app
+        self.authorize = authorize
+        self.directory = directory or PROFILE_DIR
+        self.interval = interval or PROFILE_INTERVAL
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        if headers.get("x-profile", "").lower() not in ("1", "true", "yes") or not self.authorize(headers):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            profiler.save(self.directory, profile_id)
@@ -0,0 +1,108 @@
+"""Response encoding for the API.
+
+Handlers with hot paths build plain dicts and return them through
+encoded(), which serializes them once with orjson, or with MessagePack when
+the Accept header prefers it, and skips FastAPI's jsonable_encoder pass.
+Batch results can also go out as NDJSON, one line per result as it is
+produced.
+"""
+import os
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
+
+import numpy as np
+import orjson
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import msgpack
+except ImportError:  # optional; clients asking for MessagePack get JSON
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+NDJSON = "application/x-ndjson"
+# Other names clients use for the same formats
+_ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/jsonl": NDJSON,
+    "application/jsonlines": NDJSON,
+}
+
+# Prompts analyzed and saved per step of an NDJSON batch stream
+NDJSON_CHUNK_SIZE = int(os.getenv("NDJSON_CHUNK_SIZE", "128"))
+
+_ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def dumps(content: Any) -> bytes:
+    """JSON bytes; numpy scalars and arrays are encoded natively, NaN as null"""
+    return orjson.dumps(content, option=_ORJSON_OPTIONS)
+
+def _msgpack_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content: Any) -> bytes:
+        return msgpack.packb(content, default=_msgpack_default, use_bin_type=True)
+
+def _accept_ranges(accept: str) -> Dict[str, float]:
+    """{media range: q} from an Accept header, keeping the highest q per range"""
+    ranges = {}
+    for part in accept.split(","):
+        media, *params = (piece.strip() for piece in part.split(";"))
+        if not media:
+            continue
+        media = _ALIASES.get(media.lower(), media.lower())
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media] = max(q, ranges.get(media, 0.0))
+    return ranges
+
+def preferred(accept: Optional[str], offered: Sequence[str]) -> str:
+    """The offered media type the Accept header ranks highest.
+
+    The most specific matching range sets each type's q. Ties, a missing
+    header and a header matching nothing all fall back to offered order,
+    so the first offered type is the default.
+    """
+    if not accept:
+        return offered[0]
+    ranges = _accept_ranges(accept)
+    best, best_q = offered[0], 0.0
+    for media in offered:
+        kind = media.split("/")[0]
+        q = next((ranges[r] for r in (media, f"{kind}/*", "*/*") if r in ranges), 0.0)
+        if q > best_q:
+            best, best_q = media, q
+    return best
+
+def formats(streaming: bool = False) -> Sequence[str]:
+    """Media types a handler can produce, the default first"""
+    offered = (JSON, MSGPACK) if msgpack is not None else (JSON,)
+    return offered + (NDJSON,) if streaming else offered
+
+def encoded(content: Any, accept: Optional[str] = None, status_code: int = 200, headers=None) -> Response:
+    """content serialized once in the format the client prefers"""
+    headers = {"Vary": "Accept", **(headers or {})}
+    if preferred(accept, formats()) == MSGPACK:
+        return MsgPackResponse(content, status_code=status_code, headers=headers)
+    return Response(dumps(content), status_code=status_code, headers=headers, media_type=JSON)
+
+def ndjson(items: AsyncIterator[Any], headers=None) -> StreamingResponse:
+    """Stream items as newline-delimited JSON, each sent as soon as it is produced"""
+    async def lines():
+        async for item in items:
+            yield dumps(item) + b"\n"
+    return StreamingResponse(lines(), media_type=NDJSON, headers={"Vary": "Accept", **(headers or {})})
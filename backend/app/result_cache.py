@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from app.executors import run_db
+from app.metrics import metrics
+
+# Result cache configuration (RESULT_CACHE_SIZE=0 disables caching)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH")
+RESULT_CACHE_SHARED_MAX = int(os.getenv("RESULT_CACHE_SHARED_MAX", "100000"))
+
+Analysis = Dict
+
+class SharedResultStore:
+    """Analysis results in a SQLite file shared by every worker on the host.
+
+    Results include matched PII snippets, so the file belongs on a
+    memory-backed filesystem such as /dev/shm. Expired rows, rows scored by
+    another rule pack, and the oldest rows beyond max_entries are pruned
+    every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str, ttl: float, max_entries: int):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=OFF")  # a lost write is only a cache miss
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(digest TEXT PRIMARY KEY, rules_version TEXT NOT NULL, created REAL NOT NULL, analysis TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+
+    def get_many(self, rules_version: str, digests: Iterable[str]) -> Dict[str, Analysis]:
+        digests = list(digests)
+        placeholders = ",".join("?" * len(digests))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT digest, analysis FROM results WHERE rules_version = ? AND created >= ? "
+                f"AND digest IN ({placeholders})",
+                [rules_version, time.time() - self.ttl, *digests]
+            ).fetchall()
+        return {digest: json.loads(analysis) for digest, analysis in rows}
+
+    def put_many(self, results: Dict[str, Analysis]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO results (digest, rules_version, created, analysis) VALUES (?, ?, ?, ?)",
+                [(digest, a["rules_version"], now, json.dumps(a)) for digest, a in results.items()]
+            )
+            self._writes += len(results)
+            if self._writes >= self.PRUNE_EVERY:
+                self._writes = 0
+                self._prune(now, next(iter(results.values()))["rules_version"])
+
+    def _prune(self, now: float, rules_version: str):
+        self._conn.execute(
+            "DELETE FROM results WHERE created < ? OR rules_version != ?", (now - self.ttl, rules_version)
+        )
+        self._conn.execute(
+            "DELETE FROM results WHERE digest IN "
+            "(SELECT digest FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+class ResultCache:
+    """Bounded LRU/TTL cache of analysis results keyed by prompt digest.
+
+    Entries are only valid for the rule pack that produced them: a lookup
+    under a new rules version drops the local entries, and shared rows are
+    matched on version. With a SharedResultStore, local misses fall through
+    to it so workers reuse each other's results.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600.0, shared: Optional[SharedResultStore] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # digest -> (created, analysis)
+        self._rules_version = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def lookup(self, rules_version: str, digests: Iterable[str]) -> Dict[str, Analysis]:
+        """Cached analyses for whichever of digests have one"""
+        digests = set(digests)
+        if not self.enabled:
+            return {}
+        found = self._get_local(rules_version, digests)
+        local_hits = len(found)
+        missing = digests - found.keys()
+        if missing and self.shared is not None:
+            shared = await run_db(self.shared.get_many, rules_version, missing)
+            self._put_local(shared)
+            found.update(shared)
+        self._count(local_hits, len(found) - local_hits, len(digests) - len(found))
+        return found
+
+    async def store(self, results: Dict[str, Analysis]):
+        """Cache freshly computed analyses, keyed by digest"""
+        if not self.enabled or not results:
+            return
+        self._put_local(results)
+        if self.shared is not None:
+            await run_db(self.shared.put_many, results)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _get_local(self, rules_version: str, digests) -> Dict[str, Analysis]:
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            if rules_version != self._rules_version:
+                # New rule pack: nothing cached so far is valid
+                self._entries.clear()
+                self._rules_version = rules_version
+            for digest in digests:
+                entry = self._entries.get(digest)
+                if entry is None:
+                    continue
+                created, analysis = entry
+                if now - created >= self.ttl:
+                    del self._entries[digest]
+                    continue
+                self._entries.move_to_end(digest)
+                found[digest] = analysis
+        return found
+
+    def _put_local(self, results: Dict[str, Analysis]):
+        now = time.monotonic()
+        with self._lock:
+            for digest, analysis in results.items():
+                if analysis["rules_version"] != self._rules_version:
+                    continue  # scored by a worker still on another pack
+                self._entries[digest] = (now, analysis)
+                self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, local_hits: int, shared_hits: int, misses: int):
+        self.hits += local_hits + shared_hits
+        self.misses += misses
+        if local_hits:
+            metrics.inc("result_cache_requests_total", local_hits, result="hit", tier="local")
+        if shared_hits:
+            metrics.inc("result_cache_requests_total", shared_hits, result="hit", tier="shared")
+        if misses:
+            metrics.inc("result_cache_requests_total", misses, result="miss")
+        metrics.set("result_cache_hit_ratio", self.hit_ratio)
+        metrics.set("result_cache_entries", len(self._entries))
+
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_SIZE,
+    ttl=RESULT_CACHE_TTL,
+    shared=SharedResultStore(RESULT_CACHE_PATH, RESULT_CACHE_TTL, RESULT_CACHE_SHARED_MAX) if RESULT_CACHE_PATH else None
+)
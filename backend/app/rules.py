@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import re
+import threading
+from typing import Optional, Sequence, Union
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from app.detection import Detector
+
+logger = logging.getLogger(__name__)
+
+# Rule pack configuration (rules are built in unless RULES_PATH is set)
+RULES_PATH = os.getenv("RULES_PATH")
+RULES_POLL_INTERVAL = float(os.getenv("RULES_POLL_INTERVAL", "5.0"))
+
+class RulePack:
+    """A versioned set of detection rules, loaded from JSON or YAML.
+
+    Example pack:
+
+        version: "2024-05-01"
+        pii_regex: "\\b\\d{3}-\\d{2}-\\d{4}\\b"   # a pattern, or a list of alternatives
+        bias_terms: [race, gender]
+        injection_patterns: ["ignore previous", "system prompt"]
+    """
+
+    def __init__(self, version: str, pii_regex: Union[str, Sequence[str]],
+                 bias_terms: Sequence[str], injection_patterns: Sequence[str]):
+        if not isinstance(version, str) or not version:
+            raise ValueError("Rule pack needs a non-empty string version")
+        if not isinstance(pii_regex, str):
+            pii_regex = "|".join(f"(?:{pattern})" for pattern in _strings(pii_regex, "pii_regex"))
+        try:
+            re.compile(pii_regex)
+        except re.error as e:
+            raise ValueError(f"Invalid pii_regex: {e}")
+        if _can_match_whitespace(sre_parse.parse(pii_regex)):
+            # Streamed prompts are cut for PII scanning at whitespace
+            raise ValueError("pii_regex must not match whitespace; use \\S or explicit classes instead of . or \\s")
+        self.version = version
+        self.pii_regex = pii_regex
+        self.bias_terms = tuple(term.lower() for term in _strings(bias_terms, "bias_terms"))
+        self.injection_patterns = tuple(patt.lower() for patt in _strings(injection_patterns, "injection_patterns"))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RulePack":
+        if not isinstance(data, dict):
+            raise ValueError("Rule pack must be a mapping")
+        missing = {"version", "pii_regex", "bias_terms", "injection_patterns"} - set(data)
+        if missing:
+            raise ValueError(f"Rule pack is missing {', '.join(sorted(missing))}")
+        return cls(str(data["version"]), data["pii_regex"], data["bias_terms"], data["injection_patterns"])
+
+    def compile(self) -> Detector:
+        return Detector(self.pii_regex, self.bias_terms, self.injection_patterns, version=self.version)
+
+# Whitespace Detector.feed() cuts streamed text at
+_WHITESPACE = " \t\n\r\f\v"
+_CATEGORY_ESCAPES = {
+    "CATEGORY_DIGIT": r"\d", "CATEGORY_NOT_DIGIT": r"\D",
+    "CATEGORY_SPACE": r"\s", "CATEGORY_NOT_SPACE": r"\S",
+    "CATEGORY_WORD": r"\w", "CATEGORY_NOT_WORD": r"\W",
+    "CATEGORY_LINEBREAK": r"\n", "CATEGORY_NOT_LINEBREAK": r"[^\n]",
+}
+
+def _in_set(items, ch: str) -> bool:
+    """Whether ch is in a parsed [...] character set"""
+    negate = False
+    matched = False
+    for op, av in items:
+        if op is sre_constants.NEGATE:
+            negate = True
+        elif op is sre_constants.LITERAL:
+            matched = matched or chr(av) == ch
+        elif op is sre_constants.RANGE:
+            matched = matched or av[0] <= ord(ch) <= av[1]
+        elif op is sre_constants.CATEGORY:
+            matched = matched or re.fullmatch(_CATEGORY_ESCAPES.get(str(av), r"[\s\S]"), ch) is not None
+    return matched != negate
+
+def _can_match_whitespace(parsed) -> bool:
+    """Whether a parsed pattern can consume a whitespace character (lookarounds included)"""
+    for op, av in parsed:
+        if op in (sre_constants.ANY, sre_constants.NOT_LITERAL):
+            return True
+        if op is sre_constants.LITERAL and chr(av) in _WHITESPACE:
+            return True
+        if op is sre_constants.IN and any(_in_set(av, ch) for ch in _WHITESPACE):
+            return True
+        if op is sre_constants.CATEGORY and any(_in_set([(op, av)], ch) for ch in _WHITESPACE):
+            return True
+        if op is sre_constants.BRANCH and any(_can_match_whitespace(branch) for branch in av[1]):
+            return True
+        if op is sre_constants.GROUPREF_EXISTS and any(
+                branch is not None and _can_match_whitespace(branch) for branch in av[1:]):
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and _can_match_whitespace(av[2]):
+            return True
+        if op is sre_constants.SUBPATTERN and _can_match_whitespace(av[-1]):
+            return True
+        if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT) and _can_match_whitespace(av[1]):
+            return True
+        if getattr(sre_constants, "POSSESSIVE_REPEAT", None) is op and _can_match_whitespace(av[2]):
+            return True
+        if getattr(sre_constants, "ATOMIC_GROUP", None) is op and _can_match_whitespace(av):
+            return True
+    return False
+
+def _strings(values, field: str) -> list:
+    if isinstance(values, str) or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"{field} must be a list of strings")
+    return list(values)
+
+def load_rule_pack(path: str) -> RulePack:
+    """Read and validate a rule pack; YAML packs need PyYAML installed"""
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("YAML rule packs need PyYAML: pip install pyyaml")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ValueError(f"Invalid YAML: {e}")
+    else:
+        data = json.loads(text)
+    return RulePack.from_dict(data)
+
+class RuleSource:
+    """Tracks a rule pack file and loads it again when it changes.
+
+    A change is any difference in the file's mtime, size or inode, so
+    atomic replacements (write then rename, or a ConfigMap symlink swap)
+    are picked up. A pack that fails to load is logged and skipped until
+    the file changes again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._signature = ()
+        self._lock = threading.Lock()
+
+    def poll(self, force: bool = False) -> Optional[RulePack]:
+        """Return the pack if the file changed since the last poll, else None"""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            except OSError:
+                signature = None
+            if signature == self._signature and not force:
+                return None
+            self._signature = signature
+            try:
+                return load_rule_pack(self.path)
+            except (OSError, ValueError) as e:
+                logger.error("Ignoring invalid rule pack %s: %s", self.path, e)
+                raise ValueError(f"Invalid rule pack {self.path}: {e}")
@@ -0,0 +1,40 @@
+import os
+import secrets
+from typing import Optional
+
+# Directory for state shared by every worker process on the host (unset = single worker)
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR")
+
+def shared_path(name: str) -> Optional[str]:
+    """Path of `name` inside SHARED_STATE_DIR, or None when state is not shared"""
+    if not SHARED_STATE_DIR:
+        return None
+    os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+    return os.path.join(SHARED_STATE_DIR, name)
+
+def shared_secret(name: str, size: int = 32) -> Optional[bytes]:
+    """Random key stored in SHARED_STATE_DIR, created by whichever worker asks first.
+
+    Each worker writes a candidate to its own temporary file and link()s
+    it into place, which fails if the key already exists, so workers
+    starting together all end up reading the same complete key.
+    """
+    path = shared_path(name)
+    if path is None:
+        return None
+    if not os.path.exists(path):
+        candidate = f"{path}.{os.getpid()}.tmp"
+        fd = os.open(candidate, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(secrets.token_bytes(size))
+        try:
+            os.link(candidate, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(candidate)
+    with open(path, "rb") as f:
+        key = f.read()
+    if len(key) != size:
+        raise RuntimeError(f"Shared key {path} should hold {size} bytes, found {len(key)}")
+    return key
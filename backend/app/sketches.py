@@ -0,0 +1,336 @@
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.dp_utils import laplace_noise, privatize_counts
+from app.hashing import prompt_digest
+from app.shared_state import shared_path
+
+# Sketch analytics (disabled unless ANALYTICS_SKETCH_EPSILON is set)
+ANALYTICS_SKETCH_EPSILON = float(os.getenv("ANALYTICS_SKETCH_EPSILON", "0"))
+SKETCH_HLL_PRECISION = int(os.getenv("SKETCH_HLL_PRECISION", "14"))
+SKETCH_CM_WIDTH = int(os.getenv("SKETCH_CM_WIDTH", "2048"))
+SKETCH_CM_DEPTH = int(os.getenv("SKETCH_CM_DEPTH", "4"))
+SKETCH_MAX_TERMS = int(os.getenv("SKETCH_MAX_TERMS", "8"))
+SKETCH_PATH = os.getenv("SKETCH_PATH") or shared_path("sketches.db")
+SKETCH_FLUSH_INTERVAL = float(os.getenv("SKETCH_FLUSH_INTERVAL", "5.0"))
+
+# Matched terms of these types are counted; PII matches are personal data and never are
+TERM_TYPES = ("BIAS", "INJECTION")
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Exact bit lengths of uint64 values (float log2 rounds near powers of two)"""
+    values = values.copy()
+    lengths = np.zeros(values.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+class HyperLogLog:
+    """Distinct-count sketch: 2**precision one-byte registers, merged by element-wise max.
+
+    Registers depend only on the set of hashes added, so the sketch of a
+    union is the max of the sketches, whatever the order or worker.
+    """
+
+    def __init__(self, precision: int = 14, registers: np.ndarray = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+
+    def add_hashes(self, hashes: np.ndarray):
+        """Add 64-bit hashes; the top bits pick a register, the rest set its rank"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        width = 64 - self.precision
+        index = (hashes >> np.uint64(width)).astype(np.int64)
+        rest = hashes & np.uint64((1 << width) - 1)
+        rank = (width - _bit_length(rest) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def histogram(self) -> np.ndarray:
+        """Number of registers holding each rank 0..65-precision"""
+        return np.bincount(self.registers, minlength=66 - self.precision)
+
+    def estimate(self) -> float:
+        return hll_estimate(self.histogram(), self.m)
+
+def hll_estimate(histogram: Sequence[float], m: int) -> float:
+    """Maximum-likelihood cardinality from a histogram of HyperLogLog register ranks.
+
+    Under the Poisson model with n / m = lam, a register has rank r with
+    probability c * (1 - c) where c = exp(-lam / 2**r) (rank 0: exp(-lam);
+    top rank: 1 - c). The likelihood is conditioned on the ranks present in
+    the histogram, so zeroed ranks (as after DP thresholding) only cost
+    precision, not bias. Accuracy matches the classic estimator, about
+    1.04 / sqrt(m). Below 2.5 m, where a few high ranks can pull the fit
+    far off, the empty registers give the estimate (linear counting), as
+    in the classic estimator.
+    """
+    histogram = np.asarray(histogram, dtype=float)
+    kept = histogram > 0
+    if kept.sum() <= 1:
+        # No shape to fit; take the lam at which the one rank present is most likely
+        rank = int(np.argmax(kept)) if kept.any() else 0
+        return m * math.log(2) * 2.0 ** rank if rank else 0.0
+    weights = 2.0 ** -np.arange(len(histogram))
+    counts = histogram[kept]
+
+    def log_likelihood(log_lam: float) -> float:
+        x = np.exp(log_lam) * weights
+        log_p = -x + np.log(np.maximum(-np.expm1(-x), 1e-300))
+        log_p[0] = -x[0]
+        log_p[-1] = np.log(max(-np.expm1(-x[-2]), 1e-300))
+        log_p = log_p[kept]
+        return float(counts @ log_p - counts.sum() * np.logaddexp.reduce(log_p))
+
+    # Coarse grid over lam, then golden-section refinement around the best point
+    grid = np.linspace(math.log(1e-6), math.log(2.0 ** len(histogram)), 200)
+    best = int(np.argmax([log_likelihood(g) for g in grid]))
+    lo, hi = grid[max(best - 1, 0)], grid[min(best + 1, len(grid) - 1)]
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(60):
+        a, b = hi - ratio * (hi - lo), lo + ratio * (hi - lo)
+        if log_likelihood(a) < log_likelihood(b):
+            lo = a
+        else:
+            hi = b
+    estimate = math.exp((lo + hi) / 2) * m
+    empty = min(histogram[0], m)
+    if estimate <= 2.5 * m and empty >= 1:
+        return m * math.log(m / empty)
+    return estimate
+
+@lru_cache(maxsize=65536)
+def _cells(item: str, width: int, depth: int) -> Tuple[int, ...]:
+    """Flat table index of item's cell in each row; terms repeat, so they are cached"""
+    digest = hashlib.blake2b(item.encode("utf-8"), digest_size=4 * depth).digest()
+    return tuple(row * width + int(column) % width
+                 for row, column in enumerate(np.frombuffer(digest, dtype="<u4")))
+
+class CountMin:
+    """Count-Min sketch of depth rows by width counters, merged by addition"""
+
+    def __init__(self, width: int = 2048, depth: int = 4, table: np.ndarray = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+
+    def add(self, items: Iterable[str]):
+        # Flat cell indices, counted with one bincount rather than a per-item update
+        cells = [cell for item in items for cell in _cells(item, self.width, self.depth)]
+        if cells:
+            self.table += np.bincount(cells, minlength=self.depth * self.width).reshape(self.depth, self.width)
+
+    def merge(self, other: "CountMin"):
+        self.table += other.table
+
+    def estimate(self, item: str, table: np.ndarray = None) -> float:
+        """Point query; min over rows for the exact table, median for a noisy one"""
+        table = self.table if table is None else table
+        cells = table.reshape(-1)[list(_cells(item, self.width, self.depth))]
+        return float(cells.min() if table is self.table else np.median(cells))
+
+class MemorySketchStore:
+    """Merged sketches kept in this process; lost on restart"""
+
+    def __init__(self):
+        self._arrays = {}
+        self._lock = threading.Lock()
+
+    def merge_in(self, deltas: Dict[str, Tuple[np.ndarray, str]]):
+        """Fold each (array, "max" | "add") delta into the stored array of that name"""
+        with self._lock:
+            for name, (delta, op) in deltas.items():
+                stored = self._arrays.get(name)
+                self._arrays[name] = delta.copy() if stored is None else _combine(stored, delta, op)
+
+    def load(self, name: str) -> Optional[np.ndarray]:
+        with self._lock:
+            stored = self._arrays.get(name)
+            return stored.copy() if stored is not None else None
+
+class SQLiteSketchStore:
+    """Merged sketches in a SQLite file shared by every worker.
+
+    Workers fold their deltas in under BEGIN IMMEDIATE, so concurrent
+    flushes never lose each other's updates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sketches (name TEXT PRIMARY KEY, dtype TEXT NOT NULL, "
+            "shape TEXT NOT NULL, data BLOB NOT NULL)"
+        )
+
+    def merge_in(self, deltas: Dict[str, Tuple[np.ndarray, str]]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for name, (delta, op) in deltas.items():
+                    stored = self._read(name)
+                    if stored is not None and stored.shape != delta.shape:
+                        raise ValueError(f"Stored sketch {name} has shape {stored.shape}, not {delta.shape}")
+                    merged = delta if stored is None else _combine(stored, delta, op)
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO sketches (name, dtype, shape, data) VALUES (?, ?, ?, ?)",
+                        (name, merged.dtype.str, ",".join(map(str, merged.shape)), merged.tobytes())
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, name: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._read(name)
+
+    def _read(self, name: str) -> Optional[np.ndarray]:
+        row = self._conn.execute("SELECT dtype, shape, data FROM sketches WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        dtype, shape, data = row
+        return np.frombuffer(data, dtype=dtype).reshape(tuple(int(n) for n in shape.split(","))).copy()
+
+def _combine(stored: np.ndarray, delta: np.ndarray, op: str) -> np.ndarray:
+    return np.maximum(stored, delta) if op == "max" else stored + delta
+
+def user_hash(user_id: str) -> int:
+    """64 bits of the keyed prompt hash, so register choice cannot be steered by picking user IDs"""
+    return int(prompt_digest(user_id)[:16], 16)
+
+class RiskSketches:
+    """Distinct risky users and matched-term counts in constant memory.
+
+    Each worker adds analyses to local delta sketches, which flush() folds
+    into the store; a release merges the store with the unflushed delta.
+    Memory is 2**precision bytes for the HyperLogLog plus depth x width
+    counters for the Count-Min sketch, however many records arrive.
+
+    Releases split epsilon evenly between the two:
+
+    - Distinct users: one user sets at most one register, moving it
+      between two ranks, so the histogram of register ranks has L1
+      sensitivity 2 however many records the user sends (user-level
+      privacy). Its noisy version, with noise-level ranks zeroed, feeds
+      the maximum-likelihood estimator.
+    - Terms: a record adds at most max_terms distinct terms, each to one
+      cell per row, so the table has L1 sensitivity depth * max_terms.
+      Every cell gets Laplace noise, and only terms of the active rule
+      pack, a public vocabulary, are queried, taking the median over rows.
+    """
+
+    def __init__(self, precision: int = 14, width: int = 2048, depth: int = 4, max_terms: int = 8, store=None):
+        self.precision = precision
+        self.width = width
+        self.depth = depth
+        self.max_terms = max_terms
+        self.store = store if store is not None else MemorySketchStore()
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._users = HyperLogLog(self.precision)
+        self._terms = CountMin(self.width, self.depth)
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._users.registers.nbytes + self._terms.table.nbytes
+
+    def add(self, items: List[Dict]):
+        """Fold stored analyses in: risky users into the HyperLogLog, matched terms into the Count-Min"""
+        hashes = []
+        terms = []
+        for data in items:
+            if not data["risk_factors"]:
+                continue
+            hashes.append(user_hash(data["user_id"]))
+            matched = data.get("matched_terms")
+            if matched is None:
+                # Analyses from before matched_terms; their factor matches may be truncated
+                matched = sorted({
+                    term for factor in data["risk_factors"] if factor["type"] in TERM_TYPES
+                    for term in factor["matches"]
+                })
+            terms.extend(matched[:self.max_terms])
+        with self._lock:
+            if hashes:
+                self._users.add_hashes(np.array(hashes, dtype=np.uint64))
+            self._terms.add(terms)
+
+    def flush(self):
+        """Fold this worker's delta into the store"""
+        with self._lock:
+            users, terms = self._users, self._terms
+            self._reset()
+        if not users.registers.any():
+            return
+        try:
+            self.store.merge_in({"users": (users.registers, "max"), "terms": (terms.table, "add")})
+        except BaseException:
+            with self._lock:
+                # Keep the delta for the next flush
+                self._users.merge(users)
+                self._terms.merge(terms)
+            raise
+
+    def merged(self) -> Tuple[HyperLogLog, CountMin]:
+        """The store's sketches merged with this worker's unflushed delta"""
+        users = HyperLogLog(self.precision, self.store.load("users"))
+        terms = CountMin(self.width, self.depth, self.store.load("terms"))
+        with self._lock:
+            users.merge(self._users)
+            terms.merge(self._terms)
+        return users, terms
+
+    def release(self, epsilon: float, vocabulary: Sequence[Tuple[str, str]], top: int = 10, rng=None) -> Dict:
+        """DP distinct risky users and the top terms of vocabulary, a list of (type, term)"""
+        users, terms = self.merged()
+        half = epsilon / 2
+
+        noisy_histogram = privatize_counts(users.histogram(), epsilon=half, sensitivity=2.0, rng=rng)
+        # Ranks are a fixed domain, so zeroing noise-level entries is post-processing;
+        # an empty rank survives with probability about 1e-3 / len(ranks)
+        threshold = (2.0 / half) * math.log(len(noisy_histogram) / 1e-3)
+        noisy_histogram[noisy_histogram < threshold] = 0.0
+        distinct = hll_estimate(noisy_histogram, users.m)
+
+        scale = self.depth * self.max_terms / half
+        noisy_table = terms.table + laplace_noise(terms.table.shape, scale, rng)
+        counts = sorted(
+            ((terms.estimate(term, noisy_table), risk_type, term) for risk_type, term in vocabulary),
+            reverse=True
+        )[:top]
+        return {
+            "distinct_risky_users": distinct,
+            "distinct_users_relative_error": 1.04 / math.sqrt(users.m),
+            "top_terms": [{"term": term, "type": risk_type, "count": count} for count, risk_type, term in counts],
+            "terms_accuracy_95": f"±{scale * math.log(1 / 0.05):.2f}"
+        }
+
+def _risk_sketches_from_env() -> Optional[RiskSketches]:
+    if ANALYTICS_SKETCH_EPSILON <= 0:
+        return None
+    return RiskSketches(
+        precision=SKETCH_HLL_PRECISION,
+        width=SKETCH_CM_WIDTH,
+        depth=SKETCH_CM_DEPTH,
+        max_terms=SKETCH_MAX_TERMS,
+        store=SQLiteSketchStore(SKETCH_PATH) if SKETCH_PATH else MemorySketchStore()
+    )
+
+risk_sketches = _risk_sketches_from_env()
@@ -0,0 +1,266 @@
+import atexit
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from app.shared_state import SHARED_STATE_DIR, shared_path
+
+# Per-user budgets (disabled unless USER_BUDGET is set)
+USER_BUDGET = float(os.getenv("USER_BUDGET", "0"))
+USER_BUDGET_WINDOW = float(os.getenv("USER_BUDGET_WINDOW", "86400"))
+USER_BUDGET_MAX_RESIDENT = int(os.getenv("USER_BUDGET_MAX_RESIDENT", "100000"))
+# Evicted users need a store on disk, or memory would grow with every user seen;
+# without a configured path each process gets a private temporary file
+USER_BUDGET_PATH = os.getenv("USER_BUDGET_PATH") or shared_path("users.db")
+USER_BUDGET_FLUSH_INTERVAL = float(os.getenv("USER_BUDGET_FLUSH_INTERVAL", "5.0"))
+
+class MemoryUserStore:
+    """Spent epsilon per user for the current window, kept in this process.
+
+    It holds every user seen in the window, so it is only for unbounded
+    UserBudgets (max_resident=None), such as in tests.
+    """
+
+    def __init__(self):
+        self._rows = {}
+
+    def load(self, user_id: str, window: int) -> float:
+        row = self._rows.get(user_id)
+        return row[1] if row is not None and row[0] == window else 0.0
+
+    def save_many(self, window: int, spent: Dict[str, float]):
+        for user_id, value in spent.items():
+            self._rows[user_id] = (window, value)
+
+    def prune(self, window: int):
+        self._rows = {user_id: row for user_id, row in self._rows.items() if row[0] >= window}
+
+class SQLiteUserStore:
+    """Spent epsilon per user in a SQLite file, one primary-key row per user.
+
+    Rows from earlier windows are ignored on load and deleted when a new
+    window starts, so the file only holds users active in this window.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS user_budgets "
+            "(user_id TEXT PRIMARY KEY, window INTEGER NOT NULL, spent REAL NOT NULL) WITHOUT ROWID"
+        )
+
+    def load(self, user_id: str, window: int) -> float:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT spent FROM user_budgets WHERE user_id = ? AND window = ?", (user_id, window)
+            ).fetchone()
+        return row[0] if row is not None else 0.0
+
+    def save_many(self, window: int, spent: Dict[str, float]):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO user_budgets (user_id, window, spent) VALUES (?, ?, ?)",
+                [(user_id, window, value) for user_id, value in spent.items()]
+            )
+            self._conn.execute("COMMIT")
+
+    def prune(self, window: int):
+        with self._lock:
+            self._conn.execute("DELETE FROM user_budgets WHERE window < ?", (window,))
+
+    def add(self, user_id: str, window: int, epsilon: float, limit: float = None) -> Optional[float]:
+        """Atomically add epsilon to user_id's spending in window.
+
+        Returns the new total, or None without changing anything if it
+        would exceed limit. BEGIN IMMEDIATE holds the write lock from the
+        read to the write, as in SQLiteLedger, so processes sharing the
+        file cannot overspend.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT spent FROM user_budgets WHERE user_id = ? AND window = ?", (user_id, window)
+                ).fetchone()
+                spent = max(0.0, (row[0] if row is not None else 0.0) + epsilon)
+                if limit is not None and spent > limit:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO user_budgets (user_id, window, spent) VALUES (?, ?, ?)",
+                    (user_id, window, spent)
+                )
+                self._conn.execute("COMMIT")
+                return spent
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+class UserBudgets:
+    """Per-user epsilon budgets that refill at the start of every window.
+
+    Windows are aligned to the epoch, so a 86400-second window resets
+    every user at midnight UTC. The spent epsilon of the max_resident most
+    recently active users is held in an LRU dict, so a lookup is O(1) and
+    memory is bounded however many users there are. Evicted users and
+    changed entries are written to the store by flush(), or as soon as
+    max_resident evicted users are waiting, and users who are not
+    resident are loaded from it. Eviction needs a store off the heap, so a
+    MemoryUserStore only works with max_resident=None (nothing evicted).
+    Spending adds epsilons (basic composition).
+
+    Resident entries belong to one process, so workers sharing a
+    SQLiteUserStore would not see each other's resident spending. With
+    shared=True nothing is kept resident: every charge and refund is one
+    atomic transaction on the store, so a user's requests can reach any
+    worker without spending more than the budget per window.
+
+    Calls may touch the store, so async code should make them in a thread.
+    """
+
+    def __init__(self, budget: float, window: float = 86400.0, max_resident: Optional[int] = None,
+                 store=None, clock: Callable[[], float] = time.time, shared: bool = False):
+        self.budget = budget
+        self.window = window
+        self.max_resident = max_resident
+        self.store = store if store is not None else MemoryUserStore()
+        self.clock = clock
+        self.shared = shared
+        if shared and not hasattr(self.store, "add"):
+            raise ValueError("Shared user budgets need a store with atomic add, such as SQLiteUserStore")
+        if max_resident is not None and isinstance(self.store, MemoryUserStore):
+            raise ValueError("Evicting user budgets need a persistent store, such as SQLiteUserStore")
+        self._resident = OrderedDict()  # user_id -> spent epsilon in the current window
+        self._dirty = set()
+        self._evicted = {}  # evicted but not yet flushed
+        self._window = None
+        self._lock = threading.Lock()
+
+    @property
+    def resident(self) -> int:
+        return len(self._resident)
+
+    def charge(self, user_id: str, epsilon: float):
+        """Spend epsilon from user_id's budget, or raise ValueError if it would run out"""
+        with self._lock:
+            self._roll()
+            if self.shared:
+                if self.store.add(user_id, self._window, epsilon, self.budget + 1e-9) is None:
+                    spent = self.store.load(user_id, self._window)
+                    raise ValueError(
+                        f"Privacy budget exceeded for user {user_id}. Requested: {epsilon}, "
+                        f"Available: {max(0.0, self.budget - spent):.2f}"
+                    )
+                return
+            spent = self._spent(user_id)
+            if spent + epsilon > self.budget + 1e-9:
+                raise ValueError(
+                    f"Privacy budget exceeded for user {user_id}. Requested: {epsilon}, "
+                    f"Available: {max(0.0, self.budget - spent):.2f}"
+                )
+            self._resident[user_id] = spent + epsilon
+            self._dirty.add(user_id)
+
+    def refund(self, user_id: str, epsilon: float):
+        """Return a charge whose request failed before any release"""
+        with self._lock:
+            self._roll()
+            if self.shared:
+                self.store.add(user_id, self._window, -epsilon)
+                return
+            self._resident[user_id] = max(0.0, self._spent(user_id) - epsilon)
+            self._dirty.add(user_id)
+
+    def used(self, user_id: str) -> float:
+        with self._lock:
+            self._roll()
+            if self.shared:
+                return self.store.load(user_id, self._window)
+            return self._spent(user_id)
+
+    def remaining(self, user_id: str) -> float:
+        return max(0.0, self.budget - self.used(user_id))
+
+    def window_resets_at(self) -> float:
+        """Unix time at which every budget refills"""
+        return (int(self.clock() // self.window) + 1) * self.window
+
+    def flush(self):
+        """Write changed and evicted users to the store.
+
+        Charges wait for the write, so an older snapshot can never land
+        after a newer value saved by an eviction.
+        """
+        with self._lock:
+            pending = dict(self._evicted)
+            pending.update((user_id, self._resident[user_id]) for user_id in self._dirty)
+            if self._window is None or not pending:
+                return
+            self.store.save_many(self._window, pending)
+            self._dirty.clear()
+            self._evicted.clear()
+
+    def _roll(self):
+        window = int(self.clock() // self.window)
+        if window != self._window:
+            # Everyone's budget refills; nothing from the old window matters
+            self._resident.clear()
+            self._dirty.clear()
+            self._evicted.clear()
+            self._window = window
+            self.store.prune(window)
+
+    def _spent(self, user_id: str) -> float:
+        spent = self._resident.get(user_id)
+        if spent is not None:
+            self._resident.move_to_end(user_id)
+            return spent
+        spent = self._evicted.get(user_id)
+        if spent is None:
+            spent = self.store.load(user_id, self._window)
+        self._resident[user_id] = spent
+        if self.max_resident is not None and len(self._resident) > self.max_resident:
+            evicted_id, evicted_spent = self._resident.popitem(last=False)
+            if evicted_id in self._dirty:
+                self._dirty.discard(evicted_id)
+                self._evicted[evicted_id] = evicted_spent
+            if len(self._evicted) >= self.max_resident:
+                # Don't wait for flush(); a burst of new users would grow this without bound
+                self.store.save_many(self._window, self._evicted)
+                self._evicted.clear()
+        return spent
+
+def _private_store_path() -> str:
+    """A new SQLite file, readable only by this user, deleted when the process exits"""
+    fd, path = tempfile.mkstemp(prefix="user-budgets-", suffix=".db")
+    os.close(fd)
+    atexit.register(_remove_store, path)
+    return path
+
+def _remove_store(path: str):
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+def _user_budgets_from_env() -> Optional[UserBudgets]:
+    if USER_BUDGET <= 0:
+        return None
+    return UserBudgets(
+        budget=USER_BUDGET,
+        window=USER_BUDGET_WINDOW,
+        max_resident=USER_BUDGET_MAX_RESIDENT,
+        store=SQLiteUserStore(USER_BUDGET_PATH or _private_store_path()),
+        shared=bool(SHARED_STATE_DIR)
+    )
+
+user_budgets = _user_budgets_from_env()
@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Dict, List
+
+from app.database import insert_analysis_records
+from app.executors import run_db
+
+logger = logging.getLogger(__name__)
+
+# Write-behind configuration
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+WRITE_BEHIND_PUT_TIMEOUT = float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", "0.05"))
+
+
+class WriteBehindQueue:
+    """Bounded in-memory buffer that persists records in background batches.
+
+    Records are flushed with one flush_fn call per batch once batch_size
+    records are waiting or flush_interval seconds have passed since the first
+    one arrived. When the buffer is full, put() waits up to put_timeout for
+    space and then drops the record.
+    """
+
+    def __init__(self, flush_fn: Callable[[List[Dict]], object], max_size: int = 10000,
+                 batch_size: int = 500, flush_interval: float = 1.0, put_timeout: float = 0.05):
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = None
+        self._task = None
+        self._closing = False
+        self._flushing = False
+        self._batch = []
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start the background flush task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = False
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush task and persist everything still buffered"""
+        if self._task is None:
+            return
+        # Interrupt the loop only while it is waiting for records; an in-flight
+        # flush is allowed to finish so a batch is never abandoned half-written
+        self._closing = True
+        if not self._flushing:
+            self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        leftover, self._batch = self._batch, []
+        await self._flush(leftover)
+        while self.depth:
+            await self._flush(self._drain(self.batch_size))
+
+    async def put(self, record: Dict) -> bool:
+        """Buffer a record, applying backpressure when full; False if dropped"""
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(record), timeout=self.put_timeout)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning("Write-behind queue full, dropped analysis record")
+                return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": self.depth,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+    def _drain(self, limit: int) -> List[Dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing:
+            # Records collected so far live on self._batch so stop() can
+            # flush them if it interrupts the wait
+            self._batch = [await self._queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                self._batch.extend(self._drain(self.batch_size - len(self._batch)))
+                remaining = deadline - loop.time()
+                if len(self._batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            self._flushing = True
+            try:
+                await self._flush(batch)
+            finally:
+                self._flushing = False
+
+    async def _flush(self, batch: List[Dict]):
+        if not batch:
+            return
+        try:
+            await run_db(self.flush_fn, batch)
+            self.flushed += len(batch)
+        except Exception:
+            self.failed += len(batch)
+            logger.exception("Write-behind flush of %d records failed", len(batch))
+
+
+# Shared buffer used by the API when WRITE_BEHIND_ENABLED is set
+write_behind = WriteBehindQueue(
+    insert_analysis_records,
+    max_size=WRITE_BEHIND_MAX_QUEUE,
+    batch_size=WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=WRITE_BEHIND_FLUSH_INTERVAL,
+    put_timeout=WRITE_BEHIND_PUT_TIMEOUT
+)
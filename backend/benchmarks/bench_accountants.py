@@ -0,0 +1,48 @@
+"""Queries each privacy accountant admits under one (ε, δ) target.
+
+Every query is an ε-DP Laplace release charged through PrivacyAccountant, so
+the counts are what the API would actually serve before returning 403. Run
+from the backend directory:
+
+    python -m benchmarks.bench_accountants --budget 10 --delta 1e-6
+"""
+import argparse
+import time
+
+from app.composition import COMPOSITIONS, make_composition
+from app.privacy_accountant import PrivacyAccountant
+
+QUERY_EPSILONS = (0.5, 0.1, 0.01)
+
+
+def allowed_queries(name: str, budget: float, delta: float, epsilon: float) -> int:
+    accountant = PrivacyAccountant(global_budget=budget, composition=make_composition(name, delta=delta))
+    granted = 0
+    while True:
+        try:
+            accountant.allocate_budget(epsilon)
+        except ValueError:
+            return granted
+        granted += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=10.0)
+    parser.add_argument("--delta", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    print(f"target ε={args.budget}, δ={args.delta}")
+    print(f"  {'accountant':<10}" + "".join(f"{f'ε={eps}':>12}" for eps in QUERY_EPSILONS) + f"{'µs/alloc':>12}")
+    for name in COMPOSITIONS:
+        counts = []
+        start = time.perf_counter()
+        for eps in QUERY_EPSILONS:
+            counts.append(allowed_queries(name, args.budget, args.delta, eps))
+        elapsed = time.perf_counter() - start
+        per_alloc = elapsed / (sum(counts) + len(counts)) * 1e6
+        print(f"  {name:<10}" + "".join(f"{count:>12}" for count in counts) + f"{per_alloc:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
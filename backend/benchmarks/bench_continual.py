@@ -0,0 +1,78 @@
+"""Continual release vs re-noising on every read, simulated over a stream of analyses.
+
+Each of --events analyses is one save, so one time step of the tree, and
+carries each risk type independently at the generators' default rates. A
+dashboard reads the counters every --read-every events. Three releases are
+compared at every read, against the exact counts:
+
+  tree      BinaryTreeCounters with a fixed --epsilon for the whole stream
+  re-noise  what /analytics does now: fresh noise at epsilon 0.1 per read
+  same-eps  re-noising with --epsilon split evenly across all reads
+
+Reports the epsilon each approach spends, the mean and 95th percentile
+absolute error over every counter and read, and the tree's cost per
+event and state size. Run from the backend directory:
+
+    python -m benchmarks.bench_continual --events 1000000 --read-every 1000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from app.continual import BinaryTreeCounters
+from app.database import RISK_TYPES
+from app.dp_utils import privatize_counts
+
+RATES = {"PII": 0.3, "BIAS": 0.1, "INJECTION": 0.05}
+NAMES = ("total", *RISK_TYPES)
+
+
+def errors_summary(errors) -> str:
+    errors = np.abs(np.concatenate(errors))
+    return f"mean |err| {errors.mean():10.1f}   p95 |err| {np.percentile(errors, 95):10.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--read-every", type=int, default=1000)
+    parser.add_argument("--epsilon", type=float, default=1.0, help="total budget of the tree")
+    parser.add_argument("--horizon", type=int, default=2 ** 20, help="steps per tree")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    events = np.column_stack([np.ones(args.events)] + [rng.random(args.events) < RATES[t] for t in RISK_TYPES])
+    reads = args.events // args.read_every
+    per_read_epsilon = args.epsilon / reads
+
+    tree = BinaryTreeCounters(NAMES, epsilon=args.epsilon, horizon=args.horizon, rng=rng)
+    errors = {"tree": [], "re-noise": [], "same-eps": []}
+    exact = np.zeros(len(NAMES))
+    add_time = 0.0
+    for i, row in enumerate(events, start=1):
+        step = dict(zip(NAMES, row))
+        start = time.perf_counter()
+        tree.add(step)
+        add_time += time.perf_counter() - start
+        exact += row
+        if i % args.read_every == 0:
+            released = tree.read()["counts"]
+            errors["tree"].append(np.array([released[name] for name in NAMES]) - exact)
+            errors["re-noise"].append(privatize_counts(exact, epsilon=0.1, rng=rng) - exact)
+            errors["same-eps"].append(privatize_counts(exact, epsilon=per_read_epsilon, rng=rng) - exact)
+
+    state = tree.store.load()
+    state_bytes = len(json.dumps({k: v.tolist() if hasattr(v, "tolist") else v for k, v in state.items()}))
+    print(f"{args.events} events, {reads} reads (one per {args.read_every} events), {len(NAMES)} counters")
+    print(f"  tree      eps {args.epsilon * state['trees']:10.3f}   {errors_summary(errors['tree'])}")
+    print(f"  re-noise  eps {0.1 * reads:10.3f}   {errors_summary(errors['re-noise'])}")
+    print(f"  same-eps  eps {args.epsilon:10.3f}   {errors_summary(errors['same-eps'])}")
+    print(f"  tree cost : {add_time / args.events * 1e6:.1f}µs per event, {tree.levels} levels, "
+          f"state {state_bytes} bytes ({state_bytes // len(NAMES)} per counter)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Per-prompt detection latency as the term lists grow.
+
+Compares the compiled Aho-Corasick detector against the previous
+one-`in`-check-per-term scan. Run from the backend directory:
+
+    python -m benchmarks.bench_detection
+"""
+import argparse
+import random
+import re
+import string
+import timeit
+
+from app.analysis import PII_REGEX, BIAS_TERMS, INJECTION_PATTERNS
+from app.detection import Detector
+
+
+def synthetic_terms(n: int, rng: random.Random):
+    """Generate n distinct lowercase terms of 4-12 characters"""
+    terms = set()
+    while len(terms) < n:
+        terms.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 12))))
+    return sorted(terms)
+
+
+def naive_detect(prompt, bias_terms, injection_patterns):
+    lower_prompt = prompt.lower()
+    return (
+        re.findall(PII_REGEX, prompt),
+        [term for term in bias_terms if term in lower_prompt],
+        [patt for patt in injection_patterns if patt in lower_prompt]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="8,50,500,5000", help="comma-separated term list sizes")
+    parser.add_argument("--prompt-words", type=int, default=80)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["the", "model", "should", "answer", "about", "gender", "email", "test@example.com", "ignore previous"]
+    prompt = " ".join(rng.choice(words) for _ in range(args.prompt_words))
+
+    print(f"prompt length: {len(prompt)} chars, {args.repeat} runs per size")
+    print(f"{'terms':>8} {'naive us':>10} {'compiled us':>12} {'build ms':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        extra = synthetic_terms(max(0, size - len(BIAS_TERMS)), rng)
+        bias_terms = BIAS_TERMS + extra[:len(extra) // 2]
+        injection_patterns = INJECTION_PATTERNS + extra[len(extra) // 2:]
+
+        start = timeit.default_timer()
+        detector = Detector(PII_REGEX, bias_terms, injection_patterns)
+        build_ms = (timeit.default_timer() - start) * 1e3
+        assert detector.detect(prompt) == naive_detect(prompt, bias_terms, injection_patterns)
+
+        naive = min(timeit.repeat(lambda: naive_detect(prompt, bias_terms, injection_patterns),
+                                  number=args.repeat, repeat=3)) / args.repeat
+        compiled = min(timeit.repeat(lambda: detector.detect(prompt),
+                                     number=args.repeat, repeat=3)) / args.repeat
+        print(f"{size:>8} {naive * 1e6:>10.1f} {compiled * 1e6:>12.1f} {build_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Response serialization cost before and after app.responses, and NDJSON time to first result.
+
+Part 1 encodes the bodies of three responses: one /analyze result, a
+--batch-size /analyze/batch result and an /analytics release with the
+risk-score histogram. Each is encoded along every path below:
+
+  default      what FastAPI did for the plain dicts: jsonable_encoder, then
+               JSONResponse (stdlib json)
+  model        the same through a Pydantic response model (validation and
+               dump), as a response_model would do
+  orjson       app.responses.encoded(): one orjson.dumps, no encoder pass
+  msgpack      encoded() with Accept: application/msgpack
+
+Part 2 starts uvicorn with mongomock and an unbounded budget. It posts a
+--batch-size batch --runs times with Accept: application/json and with
+Accept: application/x-ndjson, and reports the time to the first result
+and to the whole body. Run from the backend directory:
+
+    python -m benchmarks.bench_serialization --batch-size 1000
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.analysis import analyze_batch
+from app.main import AnalysisResponse, BatchAnalysisResponse, analysis_result
+from app.responses import encoded, MSGPACK
+from benchmarks.generators import generate_prompts
+
+
+def payloads(batch_size: int):
+    prompts = generate_prompts(batch_size, seed=0)
+    results = [analysis_result(analysis) for analysis in analyze_batch(prompts)]
+    analytics = {
+        "top_risks": [{"risk": "PII", "count": 40123.4}, {"risk": "BIAS", "count": 12011.9}],
+        "total_analyses": 100231.7,
+        "accuracy_95": "±29.96",
+        "privacy_guarantee": "ε=0.1",
+        "risk_score_histogram": {"bin_width": 0.01, "counts": [float(i * 37 % 1000) for i in range(100)]},
+        "risk_score_quantiles": {"p50": 0.012, "p90": 0.651, "p99": 0.952},
+        "epsilon_used": 0.15,
+    }
+    return {
+        "analyze": ({**results[0], "privacy_guarantee": "ε=0.5"}, AnalysisResponse),
+        f"batch[{batch_size}]": ({"results": results, "privacy_guarantee": "ε=0.5"}, BatchAnalysisResponse),
+        "analytics": (analytics, None),
+    }
+
+
+def encoders(model):
+    paths = {"default": lambda content: JSONResponse(jsonable_encoder(content)).body}
+    if model is not None:
+        paths["model"] = lambda content: JSONResponse(model.model_validate(content).model_dump(mode="json")).body
+    paths["orjson"] = lambda content: encoded(content).body
+    paths["msgpack"] = lambda content: encoded(content, MSGPACK).body
+    return paths
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def served(args):
+    port = free_port()
+    env = {**os.environ, "MONGO_URI": "mongomock://", "PRIVACY_BUDGET": "1e12", "SHARED_STATE_DIR": ""}
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+                             "--log-level", "warning"], env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                httpx.get(f"{base}/health")
+                break
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.2)
+        prompts = generate_prompts(args.batch_size, seed=1)
+        with httpx.Client(base_url=base, timeout=120) as client:
+            for accept in ("application/json", "application/x-ndjson"):
+                first, total = [], []
+                for run in range(args.runs + 1):
+                    # Unique prompts per run, so the result cache does not hide detection
+                    body = {"prompts": [f"{p} {run}" for p in prompts], "user_id": "bench"}
+                    start = time.perf_counter()
+                    with client.stream("POST", "/analyze/batch", json=body, headers={"Accept": accept}) as r:
+                        chunks = r.iter_bytes()
+                        next(chunks)
+                        ttfb = time.perf_counter() - start
+                        for _ in chunks:
+                            pass
+                    if run:  # the first run warms up
+                        first.append(ttfb)
+                        total.append(time.perf_counter() - start)
+                print(f"  {accept:22s} first result {statistics.median(first) * 1e3:8.1f}ms   "
+                      f"whole body {statistics.median(total) * 1e3:8.1f}ms")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5, help="served batches per Accept type")
+    args = parser.parse_args()
+
+    print("Encoding cost per response (median of 5 repeats)")
+    for name, (content, model) in payloads(args.batch_size).items():
+        baseline = None
+        for path, encode in encoders(model).items():
+            number = max(1, int(0.2 / max(timeit.timeit(lambda: encode(content), number=1), 1e-6)))
+            seconds = statistics.median(timeit.repeat(lambda: encode(content), number=number, repeat=5)) / number
+            baseline = baseline or seconds
+            print(f"  {name:12s} {path:8s} {seconds * 1e6:10.1f}µs  x{baseline / seconds:5.1f}  "
+                  f"{len(encode(content)):9,d} bytes")
+
+    print(f"\nPOST /analyze/batch with {args.batch_size} prompts through uvicorn (median of {args.runs})")
+    served(args)
+
+
+if __name__ == "__main__":
+    main()
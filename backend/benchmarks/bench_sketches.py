@@ -0,0 +1,109 @@
+"""Sketch analytics vs exact counting over a long stream of stored analyses.
+
+--records analyses arrive in batches of --batch, from user IDs drawn from
+a Zipf distribution over --users, so a few users send most records. A
+--risky fraction carry risk factors; risky records match one to three
+terms of the built-in rule pack, also Zipf-weighted. Each batch goes
+through RiskSketches.add, as persist() does, and into an exact set of
+risky users and Counter of terms for comparison.
+
+Reports the exact sketch's distinct-user error, the DP release's error
+and top-10 term recall at each --epsilons value (averaged over --trials
+releases), the sketch's fixed size against the exact structures' traced
+memory, and records per second through add(). Run from the backend
+directory:
+
+    python -m benchmarks.bench_sketches --records 10000000 --epsilons 0.1,1
+"""
+import argparse
+import os
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+# The keyed user hash needs a key; a fixed one keeps runs comparable
+os.environ.setdefault("PROMPT_HASH_SECRET", "bench-sketches")
+
+from app.analysis import BIAS_TERMS, INJECTION_PATTERNS  # noqa: E402
+from app.sketches import RiskSketches  # noqa: E402
+
+VOCABULARY = [("BIAS", term) for term in BIAS_TERMS] + [("INJECTION", term) for term in INJECTION_PATTERNS]
+
+
+def batches(args, rng):
+    weights = 1.0 / np.arange(1, len(VOCABULARY) + 1) ** 1.2
+    weights /= weights.sum()
+    remaining = args.records
+    while remaining:
+        n = min(args.batch, remaining)
+        remaining -= n
+        users = ((rng.zipf(1.3, n) - 1) % args.users).tolist()
+        risky = (rng.random(n) < args.risky).tolist()
+        picks = rng.choice(len(VOCABULARY), size=(n, 3), p=weights).tolist()
+        sizes = rng.integers(1, 4, n).tolist()
+        items = []
+        for user, is_risky, pick, size in zip(users, risky, picks, sizes):
+            factors = []
+            if is_risky:
+                by_type = {}
+                for i in pick[:size]:
+                    risk_type, term = VOCABULARY[i]
+                    by_type.setdefault(risk_type, set()).add(term)
+                factors = [{"type": t, "matches": sorted(m), "count": len(m)} for t, m in by_type.items()]
+            items.append({"user_id": f"user-{user}", "risk_factors": factors})
+        yield items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=5_000_000, help="size of the user ID space")
+    parser.add_argument("--risky", type=float, default=0.4, help="fraction of records with risk factors")
+    parser.add_argument("--batch", type=int, default=1000, help="records per add(), like one persist() batch")
+    parser.add_argument("--epsilons", default="0.1,1", help="comma-separated release budgets")
+    parser.add_argument("--trials", type=int, default=20, help="releases per epsilon")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    sketches = RiskSketches()
+    add_time = 0.0
+    tracemalloc.start()
+    exact_users = set()
+    exact_terms = Counter()
+    for items in batches(args, rng):
+        start = time.perf_counter()
+        sketches.add(items)
+        add_time += time.perf_counter() - start
+        for data in items:
+            if data["risk_factors"]:
+                exact_users.add(data["user_id"])
+                exact_terms.update((f["type"], term) for f in data["risk_factors"] for term in f["matches"])
+    exact_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    truth = len(exact_users)
+    true_top = {key for key, _ in exact_terms.most_common(10)}
+    users, _ = sketches.merged()
+    print(f"{args.records} records, {truth} distinct risky users, {len(exact_terms)} distinct terms")
+    print(f"  add()     : {args.records / add_time:,.0f} records/s ({add_time / args.records * 1e6:.1f}µs per record)")
+    print(f"  memory    : sketches {sketches.memory_bytes:,} bytes (fixed), "
+          f"exact set + Counter {exact_bytes:,} bytes")
+    print(f"  exact HLL : distinct {users.estimate():,.0f}  error {users.estimate() / truth - 1:+.2%}")
+    for epsilon in (float(e) for e in args.epsilons.split(",")):
+        errors, recalls, term_errors = [], [], []
+        for _ in range(args.trials):
+            released = sketches.release(epsilon, VOCABULARY, rng=rng)
+            errors.append(released["distinct_risky_users"] / truth - 1)
+            top = released["top_terms"]
+            recalls.append(len({(t["type"], t["term"]) for t in top} & true_top) / len(true_top))
+            term_errors.extend(abs(t["count"] - exact_terms[(t["type"], t["term"])]) for t in top)
+        errors = np.abs(errors)
+        print(f"  eps {epsilon:5g} : distinct mean |err| {errors.mean():.2%}  max {errors.max():.2%}   "
+              f"top-10 recall {np.mean(recalls):.2f}   term mean |err| {np.mean(term_errors):,.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Per-user budget charges across a large user population.
+
+Charges come from --users distinct IDs with a Zipf-like skew, so a hot
+set stays resident while the long tail is evicted to a SQLite store.
+Reports the cost per charge, the resident entry count and its memory, and
+the flush time. Run from the backend directory:
+
+    python -m benchmarks.bench_user_budgets --users 1000000 --charges 2000000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.user_budgets import SQLiteUserStore, UserBudgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--charges", type=int, default=2_000_000)
+    parser.add_argument("--max-resident", type=int, default=100_000)
+    parser.add_argument("--flush-every", type=int, default=50_000, help="charges between flushes")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    ids = (rng.zipf(1.2, size=args.charges) - 1) % args.users
+    user_ids = [f"user-{i}" for i in ids]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        budgets = UserBudgets(budget=1e9, max_resident=args.max_resident,
+                              store=SQLiteUserStore(os.path.join(tmp, "users.db")))
+        tracemalloc.start()
+        flush_time = 0.0
+        start = time.perf_counter()
+        for n, user_id in enumerate(user_ids, start=1):
+            budgets.charge(user_id, 0.5)
+            if n % args.flush_every == 0:
+                flush_start = time.perf_counter()
+                budgets.flush()
+                flush_time += time.perf_counter() - flush_start
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    charge_time = elapsed - flush_time
+    print(f"{args.charges} charges over {len(set(ids))} distinct users, max_resident={args.max_resident}")
+    print(f"  charge     : {charge_time / args.charges * 1e6:8.2f}µs each (including store loads on miss)")
+    print(f"  flushes    : {flush_time:8.2f}s total, every {args.flush_every} charges")
+    print(f"  resident   : {budgets.resident} users, peak traced memory {peak / 2**20:.1f} MiB "
+          f"(ID strings excluded)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+# Fixed key so runs are comparable and the missing-secret warning stays quiet
+os.environ.setdefault("PROMPT_HASH_SECRET", "benchmark-only-secret")
+
+# The test suite's fixture, so the two cannot drift apart
+from tests.conftest import mock_db  # noqa: E402,F401
+
+@pytest.fixture
+def client(mock_db, monkeypatch):
+    """API client with an unbounded budget and no result cache, so every request does full work"""
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.privacy_accountant import PrivacyAccountant
+    from app.result_cache import result_cache
+    
+    monkeypatch.setattr(main, "accountant", PrivacyAccountant(global_budget=1e12))
+    monkeypatch.setattr(result_cache, "max_entries", 0)
+    with TestClient(main.app) as client:
+        yield client
@@ -0,0 +1,100 @@
+"""Seeded synthetic workloads for the benchmark suite.
+
+Prompts are built word by word: each word is independently replaced by a
+PII value, bias term or injection phrase with the given densities, so a
+density of 0.01 means roughly one hit per hundred words. Lengths follow a
+fixed, uniform or lognormal (long-tailed, like real traffic) distribution
+around mean_words.
+"""
+import hashlib
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from app.analysis import BIAS_TERMS, INJECTION_PATTERNS
+
+FILLER = (
+    "the", "model", "should", "answer", "about", "report", "quarterly", "summarize", "please",
+    "team", "weather", "explain", "customer", "data", "with", "for", "and", "this", "next", "week"
+)
+SIZE_DISTRIBUTIONS = ("fixed", "uniform", "lognormal")
+
+
+def _pii(rng: random.Random) -> str:
+    kind = rng.randrange(3)
+    if kind == 0:
+        return f"user{rng.randrange(10**6)}@example.com"
+    if kind == 1:
+        return f"{rng.randrange(100, 1000)}-{rng.randrange(10, 100)}-{rng.randrange(1000, 10000)}"
+    return f"{rng.randrange(200, 1000)}.{rng.randrange(100, 1000)}.{rng.randrange(1000, 10000)}"
+
+
+def prompt_sizes(n: int, mean_words: int, distribution: str = "lognormal", seed: int = 0) -> List[int]:
+    """Word counts for n prompts; lognormal has sigma 1, so a few are ~10x the mean"""
+    if distribution not in SIZE_DISTRIBUTIONS:
+        raise ValueError(f"distribution must be one of {', '.join(SIZE_DISTRIBUTIONS)}")
+    rng = random.Random(seed)
+    if distribution == "fixed":
+        return [mean_words] * n
+    if distribution == "uniform":
+        return [rng.randint(1, 2 * mean_words - 1) for _ in range(n)]
+    mu = math.log(mean_words) - 0.5  # mean of lognormal(mu, 1) is exp(mu + 1/2)
+    return [max(1, round(rng.lognormvariate(mu, 1.0))) for _ in range(n)]
+
+
+def generate_prompt(words: int, pii_density: float = 0.0, bias_density: float = 0.0,
+                    injection_density: float = 0.0, rng: random.Random = None) -> str:
+    rng = rng or random.Random(0)
+    out = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < pii_density:
+            out.append(_pii(rng))
+        elif roll < pii_density + bias_density:
+            out.append(rng.choice(BIAS_TERMS))
+        elif roll < pii_density + bias_density + injection_density:
+            out.append(rng.choice(INJECTION_PATTERNS))
+        else:
+            out.append(rng.choice(FILLER))
+    return " ".join(out)
+
+
+def generate_prompts(n: int, mean_words: int = 60, distribution: str = "lognormal", pii_density: float = 0.01,
+                     bias_density: float = 0.01, injection_density: float = 0.005, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        generate_prompt(words, pii_density, bias_density, injection_density, rng)
+        for words in prompt_sizes(n, mean_words, distribution, seed)
+    ]
+
+
+def stream_chunks(text: str, chunk_bytes: int = 64 * 1024) -> Iterator[bytes]:
+    data = text.encode()
+    for start in range(0, len(data), chunk_bytes):
+        yield data[start:start + chunk_bytes]
+
+
+def generate_records(n: int, span: timedelta = timedelta(days=1), end: datetime = None,
+                     pii_rate: float = 0.3, bias_rate: float = 0.1, injection_rate: float = 0.05,
+                     seed: int = 0) -> List[dict]:
+    """Stored analysis documents with timestamps spread evenly over span"""
+    rng = random.Random(seed)
+    end = end or datetime(2024, 1, 2)
+    step = span / max(n, 1)
+    records = []
+    for i in range(n):
+        risk_types = [
+            risk_type for risk_type, rate in (("PII", pii_rate), ("BIAS", bias_rate), ("INJECTION", injection_rate))
+            if rng.random() < rate
+        ]
+        records.append({
+            "user_id": f"user{rng.randrange(1000)}",
+            "prompt_hash": hashlib.blake2b(str(i).encode(), digest_size=16).hexdigest(),
+            "risk_types": risk_types,
+            "risk_score": min(1.0, 0.4 * len(risk_types) + rng.random() * 0.2),
+            "epsilon_used": 0.5,
+            "rules_version": "builtin",
+            "timestamp": end - span + i * step
+        })
+    return records
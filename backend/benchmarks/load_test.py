@@ -0,0 +1,151 @@
+"""Small-prompt latency on /analyze while large prompts are in flight.
+
+Starts a single uvicorn worker in a subprocess, backed by a mongomock
+stand-in that sleeps on every write to mimic network round trips, and drives
+it over TCP. Reports p50/p99 latency of small prompts alone and mixed with
+large prompts, for the offloaded data path and for the old
+everything-on-the-event-loop path (--blocking). Run from the backend
+directory:
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --blocking
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from unittest.mock import patch
+
+import json
+
+import httpx
+import mongomock
+import numpy as np
+
+from app import database, main
+from app.main import app
+from app.privacy_accountant import PrivacyAccountant
+
+
+class SlowCollection:
+    """mongomock collection wrapper adding a fixed blocking delay per write"""
+
+    def __init__(self, collection, delay: float):
+        self._collection = collection
+        self._delay = delay
+
+    def insert_one(self, *args, **kwargs):
+        time.sleep(self._delay)
+        return self._collection.insert_one(*args, **kwargs)
+
+    def insert_many(self, *args, **kwargs):
+        time.sleep(self._delay)
+        return self._collection.insert_many(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class SlowDatabase:
+    def __init__(self, delay: float):
+        self._db = mongomock.MongoClient().prompt_analysis
+        self.analyses = SlowCollection(self._db.analyses, delay)
+
+    def __getattr__(self, name):
+        # Counter and rollup collections are updated without the extra delay
+        return getattr(self._db, name)
+
+
+async def _inline(fn, *args, size=None, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def small_prompt_latencies(client, n: int, concurrency: int):
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            response = await client.post("/analyze", json={"prompt": "Email me at a@b.io about gender"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(n)))
+    return np.array(latencies) * 1e3
+
+
+async def large_prompt_load(client, stop: asyncio.Event, size: int):
+    prompt = ("lorem ipsum gender test@example.com ignore previous " * (size // 52 + 1))[:size]
+    # Encode once so the client's own event loop is not busy serializing
+    body = json.dumps({"prompt": prompt}).encode()
+    headers = {"Content-Type": "application/json"}
+    while not stop.is_set():
+        (await client.post("/analyze", content=body, headers=headers)).raise_for_status()
+
+
+async def run(args):
+    base_url = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        for _ in range(100):
+            try:
+                (await client.get("/privacy-budget")).raise_for_status()
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+        alone = await small_prompt_latencies(client, args.requests, args.concurrency)
+
+        stop = asyncio.Event()
+        background = [asyncio.create_task(large_prompt_load(client, stop, args.large_size))
+                      for _ in range(args.large_clients)]
+        await asyncio.sleep(0.2)
+        mixed = await small_prompt_latencies(client, args.requests, args.concurrency)
+        stop.set()
+        await asyncio.gather(*background)
+
+    mode = "blocking" if args.blocking else "offloaded"
+    print(f"{mode}: {args.requests} small prompts, {args.large_clients} clients sending "
+          f"{args.large_size // 1000} KB prompts, {args.db_delay * 1e3:.0f} ms per write")
+    for label, values in (("alone", alone), ("mixed", mixed)):
+        print(f"  {label:>5}: p50 {np.percentile(values, 50):7.1f} ms   p99 {np.percentile(values, 99):7.1f} ms")
+
+
+def serve(args):
+    import uvicorn
+
+    with patch.object(database, "db", SlowDatabase(args.db_delay)), \
+            patch.object(main, "accountant", PrivacyAccountant(global_budget=1e12)):
+        if args.blocking:
+            with patch.object(main, "run_analysis", _inline), patch.object(main, "run_db", _inline):
+                uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+        else:
+            uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--large-clients", type=int, default=2)
+    parser.add_argument("--large-size", type=int, default=500_000)
+    parser.add_argument("--db-delay", type=float, default=0.005)
+    parser.add_argument("--blocking", action="store_true", help="run detection and writes on the event loop")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.load_test", "--serve"] + sys.argv[1:])
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main_()
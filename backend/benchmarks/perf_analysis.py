@@ -0,0 +1,60 @@
+"""Benchmarks for prompt analysis: single prompts, batches and streams."""
+import pytest
+
+from app.analysis import analyze_batch, analyze_prompt, feed_stream, finish_stream, start_stream
+from benchmarks.generators import generate_prompt, generate_prompts, stream_chunks
+
+# Densities per word: clean text, typical traffic, and a prompt stuffed with hits
+DENSITIES = {
+    "clean": (0.0, 0.0, 0.0),
+    "typical": (0.01, 0.01, 0.005),
+    "dense": (0.1, 0.1, 0.05),
+}
+
+
+@pytest.mark.parametrize("words", [20, 200, 2000])
+@pytest.mark.parametrize("density", list(DENSITIES))
+def test_analyze_prompt(benchmark, words, density):
+    prompt = generate_prompt(words, *DENSITIES[density])
+    result = benchmark(analyze_prompt, prompt)
+    assert 0.0 <= result["raw_risk"] <= 1.0
+
+
+@pytest.mark.parametrize("distribution", ["fixed", "lognormal"])
+def test_analyze_batch(benchmark, distribution):
+    prompts = generate_prompts(1000, mean_words=60, distribution=distribution)
+    results = benchmark(analyze_batch, prompts)
+    assert len(results) == len(prompts)
+
+
+@pytest.mark.parametrize("chunk_kb", [4, 64])
+def test_stream_scan(benchmark, chunk_kb):
+    text = generate_prompt(200_000, *DENSITIES["typical"])  # ~1.2 MB
+    chunks = [chunk.decode() for chunk in stream_chunks(text, chunk_kb * 1024)]
+    
+    def scan():
+        state = start_stream()
+        for chunk in chunks:
+            state = feed_stream(state, chunk)
+        return finish_stream(feed_stream(state, "", final=True))
+    
+    result = benchmark(scan)
+    assert result["risk_factors"]
+
+
+def test_analyze_endpoint(benchmark, client):
+    prompt = generate_prompt(60, *DENSITIES["typical"])
+    response = benchmark(client.post, "/analyze", json={"prompt": prompt, "user_id": "bench"})
+    assert response.status_code == 200
+
+
+def test_analyze_batch_endpoint(benchmark, client):
+    prompts = generate_prompts(100, mean_words=60)
+    response = benchmark(client.post, "/analyze/batch", json={"prompts": prompts, "user_id": "bench"})
+    assert response.status_code == 200
+
+
+def test_analyze_stream_endpoint(benchmark, client):
+    body = list(stream_chunks(generate_prompt(50_000, *DENSITIES["clean"]), 16 * 1024))
+    response = benchmark(lambda: client.post("/analyze/stream", content=iter(body)))
+    assert response.status_code == 200 and not response.json()["truncated"]
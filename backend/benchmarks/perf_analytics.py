@@ -0,0 +1,56 @@
+"""Benchmarks for differentially private analytics over N stored records."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from app import database
+from app.dp_utils import privatize_count, privatize_counts
+from benchmarks.generators import generate_records
+
+END = datetime(2024, 1, 2)
+
+
+@pytest.fixture(params=[1_000, 10_000], ids=lambda n: f"{n}records")
+def populated_db(request, mock_db):
+    records = generate_records(request.param, span=timedelta(days=1), end=END)
+    for start in range(0, len(records), 1000):
+        database.insert_analysis_records(records[start:start + 1000])
+    return records
+
+
+def test_get_dp_analytics(benchmark, populated_db):
+    result = benchmark(database.get_dp_analytics, 0.1)
+    assert result["top_risks"]
+
+
+def test_get_dp_risk_score_distribution(benchmark, populated_db):
+    # Reads the maintained bins only, so it should not grow with the records
+    result = benchmark(database.get_dp_risk_score_distribution, 0.1)
+    assert result["risk_score_quantiles"]["p99"] is not None
+
+
+def test_rebuild_risk_score_histogram(benchmark, populated_db):
+    # The full scan the maintained histogram replaces
+    assert benchmark(database.rebuild_risk_score_histogram, True) == {}
+
+
+def test_get_dp_rollups(benchmark, populated_db):
+    until = END  # records span the day before END
+    result = benchmark(database.get_dp_rollups, 0.1, until - timedelta(days=1), until, "minute")
+    assert len(result["buckets"]) == 1440
+
+
+def test_rebuild_risk_counters(benchmark, populated_db):
+    # The full-scan path the materialized counters replace
+    assert benchmark(database.rebuild_risk_counters, True) == {}
+
+
+def test_privatize_count(benchmark):
+    benchmark(privatize_count, 1234, 0.1)
+
+
+@pytest.mark.parametrize("n", [10, 10_000])
+def test_privatize_counts(benchmark, n):
+    values = np.random.default_rng(0).integers(0, 1000, size=n)
+    assert benchmark(privatize_counts, values, 0.1).shape == (n,)
@@ -0,0 +1,21 @@
+"""Multi-worker deployment: gunicorn -c gunicorn.conf.py app.main:app
+
+Each worker is a separate process with its own event loop, detection
+pool and in-memory caches. State that must agree across workers (the
+privacy ledger, per-user budgets, released analytics, the prompt hash key
+and metrics) lives in SQLite and plain files under SHARED_STATE_DIR, so
+more than one worker refuses to start without it.
+"""
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Workers import the app themselves; SQLite connections must not cross a fork
+preload_app = False
+graceful_timeout = 30
+
+if workers > 1 and not os.getenv("SHARED_STATE_DIR"):
+    raise RuntimeError(
+        "WEB_CONCURRENCY > 1 needs SHARED_STATE_DIR, or each worker would keep its own privacy budget"
+    )
@@ -12,4 +12,51 @@ def test_client():
     from app.main import app
     
     with TestClient(app) as client:
-        yield client
\ No newline at end of file
+        yield client
+
+@pytest.fixture(scope="function")
+def mock_db(monkeypatch):
+    """Point app.database at an in-memory mongomock database"""
+    import mongomock
+    from app import database
+    
+    mock = mongomock.MongoClient().prompt_analysis
+    monkeypatch.setattr(database, "db", mock)
+    return mock
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Released analytics and cached results must not leak between tests"""
+    from app.analytics_cache import analytics_cache
+    from app.result_cache import result_cache
+    analytics_cache.clear()
+    result_cache.clear()
+    yield
+    analytics_cache.clear()
+    result_cache.clear()
+
+@pytest.fixture
+def rule_pack(tmp_path, monkeypatch):
+    """Point app.analysis at a rule pack file; returns a writer for new versions"""
+    import json
+    from collections import OrderedDict
+    from app import analysis
+    from app.rules import RuleSource
+    
+    path = tmp_path / "rules.json"
+    monkeypatch.setattr(analysis, "_detector", analysis._detector)
+    monkeypatch.setattr(analysis, "_recent", OrderedDict(analysis._recent))
+    monkeypatch.setattr(analysis, "_rule_source", RuleSource(str(path)))
+    # Check the file on every analysis, so tests see a new version at once
+    monkeypatch.setattr(analysis, "RULES_POLL_INTERVAL", 0.0)
+    
+    def write(version, bias_terms=("bias",), injection_patterns=("ignore previous",), pii_regex=r"\d{3}-\d{2}-\d{4}"):
+        path.write_text(json.dumps({
+            "version": version,
+            "pii_regex": pii_regex,
+            "bias_terms": list(bias_terms),
+            "injection_patterns": list(injection_patterns)
+        }))
+        return path
+    
+    return write
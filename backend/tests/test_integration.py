@@ -1,14 +1,17 @@
 import pytest
+import numpy as np
+from datetime import datetime
 from unittest.mock import patch
-from app.database import save_analysis, get_dp_analytics
+from app.database import (
+    save_analysis, save_analyses, get_dp_analytics, get_dp_rollups, rebuild_risk_counters, TOTAL_COUNTER
+)
 from app.analysis import analyze_prompt
 from app.dp_utils import privatize_count
 
 class TestDatabaseIntegration:
     """Integration tests for database operations"""
     
-    @patch('app.database.db.analyses.insert_one')
-    def test_save_analysis(self, mock_insert):
+    def test_save_analysis(self, mock_db):
         analysis_data = {
             "user_id": "test_user",
             "prompt_hash": hash("test prompt"),
@@ -17,15 +20,33 @@ class TestDatabaseIntegration:
             "epsilon_used": 0.5
         }
         result = save_analysis(analysis_data)
-        mock_insert.assert_called_once()
+        assert mock_db.analyses.count_documents({}) == 1
+        assert mock_db.risk_counters.find_one({"_id": "PII"})["count"] == 1
+        assert mock_db.risk_counters.find_one({"_id": TOTAL_COUNTER})["count"] == 1
     
-    @patch('app.database.db.analyses.aggregate')
-    @patch('app.database.db.analyses.count_documents')
-    @patch('app.database.privatize_count')
-    def test_get_dp_analytics(self, mock_privatize, mock_count, mock_aggregate):
-        mock_aggregate.return_value = [{"_id": "PII", "count": 10}]
-        mock_count.return_value = 100
-        mock_privatize.side_effect = lambda x: x + 1  # Simple mock
+    def test_save_analyses_bulk(self, mock_db):
+        items = [
+            {
+                "user_id": "test_user",
+                "prompt_hash": i,
+                "risk_factors": [{"type": "PII"}] if i % 2 else [],
+                "epsilon_used": 0.5
+            }
+            for i in range(10)
+        ]
+        result = save_analyses(items)
+        
+        assert len(result.inserted_ids) == 10
+        assert mock_db.analyses.count_documents({"risk_types": "PII"}) == 5
+        assert save_analyses([]) is None
+    
+    @patch('app.database.privatize_counts')
+    def test_get_dp_analytics(self, mock_privatize, mock_db):
+        mock_db.risk_counters.insert_many([
+            {"_id": "PII", "count": 10},
+            {"_id": TOTAL_COUNTER, "count": 100}
+        ])
+        mock_privatize.side_effect = lambda x: np.asarray(x) + 1  # Simple mock
         
         analytics = get_dp_analytics(epsilon=0.1)
         
@@ -33,6 +54,476 @@ class TestDatabaseIntegration:
         assert "total_analyses" in analytics
         assert analytics["total_analyses"] == 101  # 100 + 1 from mock
 
+    def test_counters_track_writes(self, mock_db):
+        items = [
+            {"user_id": "u", "prompt_hash": i, "epsilon_used": 0.5,
+             "risk_factors": [{"type": "PII"}, {"type": "BIAS"}] if i < 3 else [{"type": "INJECTION"}]}
+            for i in range(5)
+        ]
+        save_analyses(items)
+        save_analysis(items[0])
+        
+        counters = {c["_id"]: c["count"] for c in mock_db.risk_counters.find()}
+        assert counters == {"PII": 4, "BIAS": 4, "INJECTION": 2, TOTAL_COUNTER: 6}
+        assert rebuild_risk_counters(dry_run=True) == {}
+    
+    def test_rebuild_counters_repairs_drift(self, mock_db):
+        save_analyses([
+            {"user_id": "u", "prompt_hash": i, "epsilon_used": 0.5, "risk_factors": [{"type": "PII"}]}
+            for i in range(4)
+        ])
+        mock_db.risk_counters.update_one({"_id": "PII"}, {"$inc": {"count": 3}})
+        mock_db.risk_counters.insert_one({"_id": "STALE", "count": 2})
+        
+        drift = rebuild_risk_counters(dry_run=True)
+        assert drift == {"PII": {"stored": 7, "actual": 4}, "STALE": {"stored": 2, "actual": 0}}
+        assert mock_db.risk_counters.find_one({"_id": "PII"})["count"] == 7
+        
+        assert rebuild_risk_counters() == drift
+        counters = {c["_id"]: c["count"] for c in mock_db.risk_counters.find()}
+        assert counters == {"PII": 4, TOTAL_COUNTER: 4}
+    
+    def test_admin_rebuild_counters_command(self, mock_db, capsys):
+        from app import admin
+        save_analysis({"user_id": "u", "prompt_hash": 1, "epsilon_used": 0.5, "risk_factors": [{"type": "BIAS"}]})
+        mock_db.risk_counters.delete_many({})
+        
+        assert admin.main(["rebuild-counters", "--dry-run"]) == 1
+        assert admin.main(["rebuild-counters"]) == 0
+        assert admin.main(["rebuild-counters", "--dry-run"]) == 0
+        assert '"drift": {}' in capsys.readouterr().out
+
+class TestDatabaseSetup:
+    """Lazy client creation and startup index management"""
+    
+    def test_import_opens_no_connection(self):
+        import subprocess
+        import sys
+        code = "import app.main, app.database as d; assert d.client is None and d.db is None"
+        subprocess.run([sys.executable, "-c", code], check=True, timeout=60)
+    
+    def test_client_settings(self, monkeypatch):
+        from app import database
+        monkeypatch.setattr(database, "db", None)
+        monkeypatch.setattr(database, "client", None)
+        monkeypatch.setattr(database, "MONGO_URI", "mongodb://localhost:1")
+        monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "7")
+        monkeypatch.setattr(database, "MONGO_WRITE_CONCERN", "majority")
+        db = database.get_db()
+        try:
+            assert database.get_db() is db
+            assert db.write_concern.document == {"w": "majority"}
+            assert database.client.options.pool_options.max_pool_size == 7
+        finally:
+            database.client.close()
+    
+    def test_ensure_indexes(self, mock_db, monkeypatch):
+        from app import database
+        database.ensure_indexes()
+        analyses = mock_db.analyses.index_information()
+        assert analyses["user_timestamp"]["key"] == [("user_id", 1), ("timestamp", 1)]
+        assert "expireAfterSeconds" not in analyses["timestamp_retention"]
+        assert mock_db.risk_rollups.index_information()["granularity_bucket"]
+        
+        monkeypatch.setattr(database, "ANALYSIS_RETENTION_DAYS", "30")
+        database.ensure_indexes()
+        assert mock_db.analyses.index_information()["timestamp_retention"]["expireAfterSeconds"] == 30 * 86400
+        assert database.ensure_indexes() == database.ensure_indexes()  # idempotent
+    
+    def test_retention_change_is_applied_in_place(self, mock_db, monkeypatch):
+        from unittest.mock import Mock
+        from app import database
+        monkeypatch.setattr(database, "ANALYSIS_RETENTION_DAYS", "30")
+        database.ensure_indexes()
+        monkeypatch.setattr(database, "ANALYSIS_RETENTION_DAYS", "7")
+        monkeypatch.setattr(mock_db, "command", Mock())
+        database.ensure_indexes()
+        mock_db.command.assert_called_once_with(
+            "collMod", "analyses", index={"name": "timestamp_retention", "expireAfterSeconds": 7 * 86400}
+        )
+
+class TestCompactRecords:
+    """Compact analysis documents and the migration to them"""
+    
+    @staticmethod
+    def items(n=10):
+        return [
+            {"user_id": f"u{i % 3}", "prompt_hash": f"{i:032x}", "epsilon_used": 0.5, "raw_risk": 0.1 * i,
+             "rules_version": "builtin",
+             "risk_factors": [{"type": t} for t in ("PII", "BIAS", "INJECTION")[:i % 4]]}
+            for i in range(n)
+        ]
+    
+    def test_round_trip(self):
+        from datetime import datetime
+        from app.database import compact_record, expand_record
+        record = {
+            "user_id": "u", "prompt_hash": "ab" * 16, "risk_types": ["PII", "INJECTION"], "risk_score": 0.9,
+            "epsilon_used": 0.5, "rules_version": "v1", "timestamp": datetime(2024, 5, 1, 12, 34, 56, 789)
+        }
+        compact = compact_record(record)
+        assert compact["r"] == 0b101 and compact["h"] == b"\xab" * 16
+        assert compact["t"] == datetime(2024, 5, 1, 12, 34)
+        assert expand_record(compact) == {**record, "timestamp": datetime(2024, 5, 1, 12, 34)}
+        assert compact_record({**record, "prompt_hash": -5})["h"] == (-5).to_bytes(8, "big", signed=True)
+    
+    @patch('app.database.privatize_counts', side_effect=lambda x: np.asarray(x, dtype=float))
+    def test_analytics_identical_on_both_formats(self, mock_privatize, mock_db, monkeypatch):
+        import mongomock
+        from app import database
+        save_analyses(self.items())
+        full = get_dp_analytics(epsilon=0.1)
+        
+        monkeypatch.setattr(database, "db", mongomock.MongoClient().compact)
+        monkeypatch.setattr(database, "RECORD_FORMAT", "compact")
+        save_analyses(self.items())
+        assert all("f" in doc and "risk_types" not in doc for doc in database.db.analyses.find())
+        assert get_dp_analytics(epsilon=0.1) == full
+        assert rebuild_risk_counters(dry_run=True) == {}
+    
+    @patch('app.database.privatize_counts', side_effect=lambda x: np.asarray(x, dtype=float))
+    def test_migration(self, mock_privatize, mock_db):
+        from app.database import compact_existing_records
+        save_analyses(self.items(10))
+        mock_db.analyses.insert_one({"user_id": "legacy", "prompt_hash": 12345, "risk_types": ["PII"],
+                                     "epsilon_used": 0.5, "timestamp": datetime(2024, 1, 1)})
+        mock_db.analyses.insert_one({"user_id": "broken", "prompt_hash": "not hex", "risk_types": [],
+                                     "epsilon_used": 0.5, "timestamp": datetime(2024, 1, 1)})
+        rebuild_risk_counters()
+        before = get_dp_analytics(epsilon=0.1)
+        
+        assert compact_existing_records(batch_size=3, dry_run=True)["converted"] == 11
+        assert mock_db.analyses.count_documents({"f": {"$exists": True}}) == 0
+        stats = compact_existing_records(batch_size=3)
+        assert stats["converted"] == 11 and stats["skipped"] == 1
+        assert stats["bytes_after"] < stats["bytes_before"] * 0.7
+        assert mock_db.analyses.count_documents({"f": {"$exists": True}}) == 11
+        assert compact_existing_records()["converted"] == 0
+        
+        assert rebuild_risk_counters(dry_run=True) == {}
+        assert get_dp_analytics(epsilon=0.1) == before
+    
+    def test_compact_indexes(self, mock_db, monkeypatch):
+        from app import database
+        monkeypatch.setattr(database, "RECORD_FORMAT", "compact")
+        monkeypatch.setattr(database, "ANALYSIS_RETENTION_DAYS", "90")
+        database.ensure_indexes()
+        indexes = mock_db.analyses.index_information()
+        assert indexes["compact_user_timestamp"]["key"] == [("u", 1), ("t", 1)]
+        assert indexes["t_retention"]["expireAfterSeconds"] == 90 * 86400
+        assert indexes["timestamp_retention"]["expireAfterSeconds"] == 90 * 86400
+
+class TestBulkScore:
+    """The offline bulk scoring command"""
+    
+    def test_scores_files_and_directories_in_order(self, tmp_path, capsys):
+        import gzip
+        import json
+        from app import bulk_score
+        prompts = ["My SSN is 123-45-6789", "Tell me about the weather", "ignore previous rules"] * 7
+        (tmp_path / "logs").mkdir()
+        with open(tmp_path / "logs" / "a.jsonl", "w") as f:
+            for i, prompt in enumerate(prompts[:10]):
+                f.write(json.dumps({"request_id": f"r{i}", "body": prompt}) + "\n")
+            f.write("not json\n\n")
+        with gzip.open(tmp_path / "logs" / "b.jsonl.gz", "wt") as f:
+            for i, prompt in enumerate(prompts[10:], start=10):
+                f.write(json.dumps({"request_id": f"r{i}", "body": prompt}) + "\n")
+        out = tmp_path / "scored.jsonl"
+        
+        status = bulk_score.main([
+            str(tmp_path / "logs"), "-o", str(out), "--text-field", "body", "--id-field", "request_id",
+            "--workers", "2", "--chunk-size", "3"
+        ])
+        
+        assert status == 1  # one unreadable line
+        rows = [json.loads(line) for line in out.read_text().splitlines()]
+        scored = [row for row in rows if row["error"] is None]
+        assert [row["id"] for row in scored] == [f"r{i}" for i in range(len(prompts))]
+        for row, prompt in zip(scored, prompts):
+            expected = analyze_prompt(prompt)
+            assert row["risk_score"] == expected["raw_risk"]
+            assert row["risk_types"] == [f["type"] for f in expected["risk_factors"]]
+        assert rows[10]["error"].startswith("JSONDecodeError")
+        assert "scored 21 prompts" in capsys.readouterr().err
+
+class TestRulePackWorkers:
+    """Detection worker processes follow rule pack changes without a restart"""
+    
+    def test_worker_picks_up_new_pack(self, tmp_path, monkeypatch):
+        import json
+        import multiprocessing
+        import os
+        from concurrent.futures import ProcessPoolExecutor
+        path = tmp_path / "rules.json"
+        
+        def write(version, term):
+            path.write_text(json.dumps({
+                "version": version, "pii_regex": "x^", "bias_terms": [term], "injection_patterns": []
+            }))
+        
+        write("v1", "weather")
+        monkeypatch.setenv("RULES_PATH", str(path))
+        monkeypatch.setenv("RULES_POLL_INTERVAL", "0")
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            first = pool.submit(analyze_prompt, "weather in lisbon").result()
+            write("v2", "lisbon")
+            os.utime(path, ns=(1, 1))
+            second = pool.submit(analyze_prompt, "weather in lisbon").result()
+        
+        assert (first["rules_version"], first["risk_factors"][0]["matches"]) == ("v1", ["weather"])
+        assert (second["rules_version"], second["risk_factors"][0]["matches"]) == ("v2", ["lisbon"])
+
+class TestRollups:
+    """Integration tests for time-bucketed rollups"""
+    
+    @staticmethod
+    def save_at(timestamp, risk_types, risk_score):
+        from datetime import datetime
+        with patch('app.database.datetime') as mock_datetime:
+            mock_datetime.utcnow.return_value = timestamp
+            save_analysis({
+                "user_id": "u", "prompt_hash": 1, "epsilon_used": 0.5, "raw_risk": risk_score,
+                "risk_factors": [{"type": t} for t in risk_types]
+            })
+    
+    def test_rollups_maintained_on_write(self, mock_db):
+        from datetime import datetime
+        self.save_at(datetime(2024, 5, 1, 10, 15, 30), ["PII"], 0.4)
+        self.save_at(datetime(2024, 5, 1, 10, 15, 50), ["PII", "BIAS"], 0.7)
+        self.save_at(datetime(2024, 5, 1, 11, 0, 5), [], 0.0)
+        
+        minute = mock_db.risk_rollups.find_one({"_id": "minute:2024-05-01T10:15:00"})
+        assert minute["count"] == 2
+        assert minute["risk_types"] == {"PII": 2, "BIAS": 1}
+        assert minute["risk_score_sum"] == pytest.approx(1.1)
+        assert mock_db.risk_rollups.count_documents({"granularity": "hour"}) == 2
+        day = mock_db.risk_rollups.find_one({"granularity": "day"})
+        assert day["count"] == 3
+        assert day["bucket"] == datetime(2024, 5, 1)
+    
+    @patch('app.database.privatize_counts')
+    def test_windowed_analytics_from_rollups(self, mock_privatize, mock_db):
+        from datetime import datetime
+        mock_privatize.side_effect = lambda values, epsilon: np.asarray(values, dtype=float)
+        self.save_at(datetime(2024, 5, 1, 10, 15), ["PII"], 0.4)
+        self.save_at(datetime(2024, 5, 1, 12, 30), ["INJECTION"], 0.8)
+        
+        result = get_dp_rollups(1.0, datetime(2024, 5, 1, 10, 0), datetime(2024, 5, 1, 13, 0), "hour")
+        
+        assert [b["start"] for b in result["buckets"]] == [
+            "2024-05-01T10:00:00", "2024-05-01T11:00:00", "2024-05-01T12:00:00"
+        ]
+        assert [b["count"] for b in result["buckets"]] == [1, 0, 1]
+        assert result["buckets"][0]["risk_types"] == {"PII": 1, "BIAS": 0, "INJECTION": 0}
+        assert result["buckets"][2]["avg_risk_score"] == pytest.approx(0.8)
+        assert result["buckets"][1]["avg_risk_score"] is None
+        # Five released values per bucket share the query's epsilon, drawn in one call
+        assert mock_privatize.call_count == 1
+        assert mock_privatize.call_args.kwargs["epsilon"] == pytest.approx(0.2)
+    
+    def test_windowed_analytics_bucket_limit(self, mock_db):
+        from datetime import datetime
+        with pytest.raises(ValueError):
+            get_dp_rollups(1.0, datetime(2024, 1, 1), datetime(2024, 3, 1), "minute")
+
+class TestRiskScoreHistogram:
+    """Risk-score histogram maintained on write and its DP quantiles"""
+
+    @staticmethod
+    def items(scores):
+        return [
+            {"user_id": "u", "prompt_hash": i, "epsilon_used": 0.5, "raw_risk": score, "risk_factors": []}
+            for i, score in enumerate(scores)
+        ]
+
+    def test_histogram_maintained_on_write(self, mock_db):
+        save_analyses(self.items([0.0, 0.0, 0.305, 1.0]))
+        save_analysis(self.items([0.309])[0])
+
+        bins = {b["bin"]: b["count"] for b in mock_db.risk_score_histogram.find({"bins": 100})}
+        assert bins == {0: 2, 30: 2, 99: 1}
+        assert mock_db.risk_score_histogram.find_one({"_id": "100:30"})["count"] == 2
+
+    def test_rebuild_histogram(self, mock_db, monkeypatch):
+        from app import database
+        from app.database import rebuild_risk_score_histogram
+        save_analyses(self.items([0.1, 0.5, 0.5]))
+        assert rebuild_risk_score_histogram(dry_run=True) == {}
+
+        # A new bin count starts an empty histogram until it is rebuilt
+        monkeypatch.setattr(database, "RISK_SCORE_BINS", 10)
+        drift = rebuild_risk_score_histogram()
+        assert drift == {"10:1": {"stored": 0, "actual": 1}, "10:5": {"stored": 0, "actual": 2}}
+        assert rebuild_risk_score_histogram(dry_run=True) == {}
+        assert mock_db.risk_score_histogram.count_documents({"bins": 100}) == 2
+
+        # Bins computed by the server match the ones written on save, ends included
+        monkeypatch.setattr(database, "RISK_SCORE_BINS", 100)
+        save_analyses(self.items([0.0, 0.29, 0.999, 1.0, 1.5]))
+        mock_db.risk_score_histogram.delete_many({})
+        rebuild_risk_score_histogram()
+        bins = {b["bin"]: b["count"] for b in mock_db.risk_score_histogram.find({"bins": 100})}
+        assert bins == {0: 1, 10: 1, 28: 1, 50: 2, 99: 3}
+
+    def test_dp_quantiles(self, mock_db):
+        from app.database import get_dp_risk_score_distribution
+        # Quantile ranks 500, 900 and 990 fall inside the bins at 0.0, 0.65 and 0.95
+        scores = np.r_[np.zeros(510), np.full(385, 0.305), np.full(93, 0.655), np.full(12, 0.955)]
+        save_analyses(self.items(scores))
+
+        released = get_dp_risk_score_distribution(epsilon=1000.0, rng=0)
+        assert len(released["risk_score_histogram"]["counts"]) == 100
+        assert sum(released["risk_score_histogram"]["counts"]) == pytest.approx(1000, abs=1)
+        quantiles = released["risk_score_quantiles"]
+        assert quantiles["p50"] == pytest.approx(0.01, abs=0.005)
+        assert 0.65 <= quantiles["p90"] <= 0.66
+        assert 0.95 <= quantiles["p99"] <= 0.96
+
+    @patch('app.database.privatize_counts')
+    def test_analytics_include_distribution_only_when_paid_for(self, mock_privatize, mock_db):
+        mock_privatize.side_effect = lambda values, epsilon=0.1, rng=None: np.asarray(values, dtype=float)
+        save_analyses(self.items([0.2, 0.4]))
+
+        assert "risk_score_quantiles" not in get_dp_analytics(epsilon=0.1)
+        analytics = get_dp_analytics(epsilon=0.1, score_epsilon=0.05)
+        assert analytics["risk_score_quantiles"]["p50"] == pytest.approx(0.21)
+        assert mock_privatize.call_args.kwargs["epsilon"] == 0.05
+
+def _drain_shared_ledger(path, epsilon, lease_size):
+    """Worker process: allocate from a shared SQLite ledger until refused"""
+    from concurrent.futures import ThreadPoolExecutor
+    from app.privacy_accountant import PrivacyAccountant, SQLiteLedger
+    accountant = PrivacyAccountant(global_budget=10.0, ledger=SQLiteLedger(path), lease_size=lease_size)
+    
+    def drain():
+        granted = 0
+        while True:
+            try:
+                accountant.allocate_budget(epsilon)
+            except ValueError:
+                return granted
+            granted += 1
+    
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        granted = sum(pool.map(lambda _: drain(), range(4)))
+    accountant.release_lease()
+    return granted
+
+class TestSharedPrivacyLedger:
+    """Concurrency stress tests for the persistent privacy ledger"""
+    
+    @pytest.mark.parametrize("lease_size", [0.0, 0.35])
+    def test_spend_never_exceeds_budget_across_processes(self, tmp_path, lease_size):
+        import multiprocessing
+        from app.privacy_accountant import SQLiteLedger
+        path = str(tmp_path / "ledger.db")
+        # SQLite lock state must not be inherited by the forked workers
+        SQLiteLedger(path)._conn.close()
+        
+        with multiprocessing.get_context("fork").Pool(8) as pool:
+            granted = pool.starmap(_drain_shared_ledger, [(path, 0.05, lease_size)] * 8)
+        
+        spent = sum(granted) * 0.05
+        assert spent <= 10.0 + 1e-9
+        assert spent >= 10.0 - 0.05 - 1e-9  # released leases leave nothing stranded
+        assert SQLiteLedger(path).used == pytest.approx(spent)
+    
+    def test_ledger_survives_restart(self, tmp_path):
+        from app.privacy_accountant import PrivacyAccountant, SQLiteLedger
+        path = str(tmp_path / "ledger.db")
+        PrivacyAccountant(global_budget=1.0, ledger=SQLiteLedger(path)).allocate_budget(0.75)
+        
+        restarted = PrivacyAccountant(global_budget=1.0, ledger=SQLiteLedger(path))
+        assert restarted.used_epsilon == 0.75
+        with pytest.raises(ValueError):
+            restarted.allocate_budget(0.5)
+
+class TestMultiWorkerDeployment:
+    """gunicorn with several workers sharing SHARED_STATE_DIR"""
+    
+    @pytest.fixture
+    def server(self, tmp_path):
+        import os
+        import socket
+        import subprocess
+        import sys
+        import time
+        import httpx
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = {
+            **os.environ,
+            "SHARED_STATE_DIR": str(tmp_path),
+            "MONGO_URI": "mongomock://",
+            "WEB_CONCURRENCY": "2",
+            "BIND": f"127.0.0.1:{port}",
+            "PRIVACY_BUDGET": "5.0",
+            "USER_BUDGET": "1.0",
+            "METRICS_SNAPSHOT_INTERVAL": "0.2",
+            "ANALYSIS_WORKERS": "1",
+        }
+        env.pop("PROMPT_HASH_SECRET", None)
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            deadline = time.monotonic() + 60
+            while len(list((tmp_path / "metrics").glob("*.json"))) < 2:
+                assert proc.poll() is None and time.monotonic() < deadline, "workers did not start"
+                time.sleep(0.2)
+            yield base, tmp_path
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    
+    def test_workers_share_budgets_and_metrics(self, server):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        import httpx
+        base, state_dir = server
+        
+        def analyze(user_id):
+            # A new connection per request lets either worker accept it
+            with httpx.Client(base_url=base) as client:
+                return client.post("/analyze", json={"prompt": "hello", "user_id": user_id}).status_code
+        
+        with ThreadPoolExecutor(8) as pool:
+            # Two 0.5 requests per user fit in 1.0, whichever worker serves them
+            statuses = list(pool.map(analyze, [f"user{i % 4}" for i in range(16)]))
+            assert statuses.count(200) == 8 and statuses.count(403) == 8
+            # Fresh users, but only 1.0 of the global 5.0 is left
+            statuses = list(pool.map(analyze, [f"other{i}" for i in range(8)]))
+            assert statuses.count(200) == 2 and statuses.count(403) == 6
+        
+        time.sleep(0.5)  # one snapshot interval, so both workers have published
+        with httpx.Client(base_url=base) as client:
+            budget = client.get("/privacy-budget", params={"user_id": "user0"}).json()
+            exposition = client.get("/metrics").text
+        assert budget["used_epsilon"] == pytest.approx(5.0)
+        assert budget["user"]["used_epsilon"] == pytest.approx(1.0)
+        assert "analyses_total 10" in exposition.splitlines()
+        workers = {line.split('worker="')[1].split('"')[0]
+                   for line in exposition.splitlines() if line.startswith("privacy_budget_epsilon_used{")}
+        assert len(workers) == 2
+        assert len((state_dir / "prompt_hash.key").read_bytes()) == 32
+    
+    def test_refuses_several_workers_without_shared_state(self):
+        import os
+        import subprocess
+        import sys
+        env = {k: v for k, v in os.environ.items() if k != "SHARED_STATE_DIR"}
+        env["WEB_CONCURRENCY"] = "2"
+        result = subprocess.run(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--check-config", "app.main:app"],
+            env=env, capture_output=True, text=True, timeout=60
+        )
+        assert result.returncode != 0
+        assert "SHARED_STATE_DIR" in result.stdout + result.stderr
+
 class TestFullAnalysisIntegration:
     """Integration tests for full analysis pipeline"""
     
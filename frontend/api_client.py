@@ -0,0 +1,109 @@
+"""Backend data layer for the dashboard.
+
+One pooled requests.Session is shared by every browser session
+(st.cache_resource), so reruns reuse keep-alive connections instead of
+opening a new one per call. Privacy budget and analytics are cached across
+sessions with st.cache_data: all open dashboards share one backend call
+per refresh window, which for /analytics also means one epsilon spend.
+Every request has a timeout. Idempotent GETs are retried with exponential
+backoff on connection errors and 502/503/504; POST /analyze only on
+connection errors, when nothing reached the backend.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
+# (connect, read) seconds
+BACKEND_TIMEOUT = (float(os.getenv("BACKEND_CONNECT_TIMEOUT", "3")), float(os.getenv("BACKEND_READ_TIMEOUT", "30")))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "3"))
+BACKEND_BACKOFF = float(os.getenv("BACKEND_BACKOFF", "0.5"))  # 0.5s, 1s, 2s, ...
+# Connections kept open to the backend, shared by all sessions
+BACKEND_POOL_SIZE = int(os.getenv("BACKEND_POOL_SIZE", "20"))
+
+# Seconds a fetched value is shared by every session before the next backend call
+BUDGET_REFRESH = int(os.getenv("BUDGET_REFRESH", "10"))
+ANALYTICS_REFRESH = int(os.getenv("ANALYTICS_REFRESH", "300"))
+# Refresh Analytics only refetches values at least this old, so clicks cannot drain the budget
+ANALYTICS_MIN_REFRESH = int(os.getenv("ANALYTICS_MIN_REFRESH", "60"))
+
+class BackendError(Exception):
+    """The backend could not be reached or refused the request"""
+
+@st.cache_resource
+def session() -> requests.Session:
+    """Process-wide session with a connection pool and retries"""
+    retry = Retry(
+        total=BACKEND_RETRIES,
+        backoff_factor=BACKEND_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=BACKEND_POOL_SIZE, max_retries=retry)
+    s = requests.Session()
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+def _request(method: str, path: str, **kwargs) -> Dict:
+    try:
+        response = session().request(method, f"{BACKEND_URL}{path}", timeout=BACKEND_TIMEOUT, **kwargs)
+    except requests.RequestException as e:
+        raise BackendError(f"Backend unreachable: {e}") from e
+    if response.status_code >= 400:
+        try:
+            detail = response.json().get("detail", response.reason)
+        except ValueError:
+            detail = response.reason
+        raise BackendError(f"{response.status_code}: {detail}")
+    try:
+        return response.json()
+    except ValueError as e:
+        raise BackendError(f"Invalid response from backend: {e}") from e
+
+# Failed calls raise, and st.cache_data caches nothing for them, so the next rerun tries again
+@st.cache_data(ttl=BUDGET_REFRESH, show_spinner=False)
+def privacy_budget() -> Dict:
+    return _request("GET", "/privacy-budget")
+
+@st.cache_data(ttl=ANALYTICS_REFRESH, show_spinner=False)
+def analytics() -> Tuple[Dict, float]:
+    """(analytics, time fetched); each call that misses the cache spends backend epsilon"""
+    return _request("GET", "/analytics"), time.time()
+
+def refresh_analytics() -> bool:
+    """Drop the shared analytics if they are old enough; False if they are too fresh"""
+    _, fetched_at = analytics()
+    if time.time() - fetched_at < ANALYTICS_MIN_REFRESH:
+        return False
+    analytics.clear()
+    return True
+
+def dashboard_data() -> Tuple[Optional[Dict], Optional[Tuple[Dict, float]]]:
+    """Privacy budget and analytics, fetched concurrently; None for a part that failed"""
+    ctx = get_script_run_ctx()
+    # Worker threads run with this script's context, as Streamlit's caches expect
+    with ThreadPoolExecutor(max_workers=2,
+                            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as pool:
+        budget = pool.submit(privacy_budget)
+        released = pool.submit(analytics)
+    return _result(budget), _result(released)
+
+def _result(future):
+    try:
+        return future.result()
+    except BackendError:
+        return None
+
+def analyze(prompt: str) -> Dict:
+    """Analyze a prompt; never cached, since every call is charged to the budget"""
+    return _request("POST", "/analyze", json={"prompt": prompt})
@@ -1,23 +1,13 @@
 import streamlit as st
-import requests
-import os
+import api_client
 import time
 
-# Configuration
-BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
-ANALYTICS_REFRESH = 300  # 5 minutes cache
-
 st.set_page_config(
     page_title="Privacy-Preserving Prompt Analyzer",
     page_icon="🔒",
     layout="wide"
 )
 
-# Session state for caching
-if 'analytics' not in st.session_state:
-    st.session_state.analytics = None
-    st.session_state.analytics_time = 0
-
 # UI Components
 st.title("🔒 Privacy-Preserving Prompt Analyzer")
 st.markdown("""
@@ -29,10 +19,12 @@ _Analyze LLM prompts for risks without compromising user privacy_
 - Differential privacy guarantees
 """)
 
+# Budget and analytics come from caches shared by every session, fetched together
+budget, released = api_client.dashboard_data()
+
 # Privacy budget display
-def show_privacy_budget():
+def show_privacy_budget(budget):
     try:
-        budget = requests.get(f"{BACKEND_URL}/privacy-budget").json()
         remaining = budget['remaining_budget']
         
         col1, col2, col3 = st.columns(3)
@@ -49,7 +41,7 @@ def show_privacy_budget():
     except:
         st.error("Could not retrieve privacy budget")
 
-show_privacy_budget()
+show_privacy_budget(budget)
 
 # Main analysis form
 with st.form("analysis_form"):
@@ -60,10 +52,7 @@ with st.form("analysis_form"):
     if submitted and prompt.strip():
         with st.spinner("Analyzing with privacy protection..."):
             try:
-                response = requests.post(
-                    f"{BACKEND_URL}/analyze",
-                    json={"prompt": prompt}
-                ).json()
+                response = api_client.analyze(prompt)
                 
                 # Display results
                 st.subheader("Analysis Results")
@@ -101,29 +90,26 @@ with st.form("analysis_form"):
 st.divider()
 st.subheader("Aggregate Insights")
 
-# Refresh analytics if stale
-current_time = time.time()
-if current_time - st.session_state.analytics_time > ANALYTICS_REFRESH:
-    try:
-        analytics = requests.get(f"{BACKEND_URL}/analytics").json()
-        st.session_state.analytics = analytics
-        st.session_state.analytics_time = current_time
-    except:
-        st.error("Could not load analytics")
+if released is None:
+    st.error("Could not load analytics")
 
 if st.button("🔄 Refresh Analytics", help="Get latest insights with privacy protection"):
-    try:
-        analytics = requests.get(f"{BACKEND_URL}/analytics").json()
-        st.session_state.analytics = analytics
-        st.session_state.analytics_time = time.time()
-        st.success("Analytics refreshed with privacy protection")
-    except:
-        st.error("Could not refresh analytics")
+    # Analytics are shared by every viewer, so only stale ones are refetched
+    if released is None or api_client.refresh_analytics():
+        try:
+            released = api_client.analytics()
+            st.success("Analytics refreshed with privacy protection")
+        except api_client.BackendError:
+            st.error("Could not refresh analytics")
+    else:
+        st.info(f"Analytics are at most {api_client.ANALYTICS_MIN_REFRESH}s old and shared by all viewers; "
+                "try again later")
 
-if st.session_state.analytics:
-    analytics = st.session_state.analytics
+if released:
+    analytics, fetched_at = released
     st.caption(f"**Privacy Guarantee**: {analytics.get('privacy_guarantee', 'ε=0.1')} | "
-               f"**Accuracy**: {analytics.get('accuracy_95', '±N/A')} (95% confidence)")
+               f"**Accuracy**: {analytics.get('accuracy_95', '±N/A')} (95% confidence) | "
+               f"**Updated**: {time.strftime('%H:%M:%S', time.localtime(fetched_at))}")
     
     col1, col2 = st.columns(2)
     with col1: